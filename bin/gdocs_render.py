@@ -21,6 +21,7 @@
 
 import codecs
 import logging
+from multiprocessing.pool import ThreadPool
 from optparse import OptionParser
 import os
 import pprint
@@ -31,14 +32,34 @@ sys.path += [
     os.path.join(os.path.dirname(sys.modules[__name__].__file__), '..', 'lib')]
 
 from homnivore import fatsecret
+from homnivore import journal
+from homnivore import mapping
+from homnivore import nutrition
+from homnivore import prefetch
 from homnivore import recipe
 
+
 op = OptionParser(
     usage='''%prog [options] <consumer key> <secret key> <ingredients-file>
 <servings>''',
     description='''Read ingredients interactively on stdin (presenting a menu
 for clarification in some places and finally write a Nutrition: ... line
 to stdout when we're done.''')
+op.add_option('-j', dest='threads', type='int', default=4,
+    help='number of FatSecret calls to make in the background at once ' + \
+        '(default: %default)')
+op.add_option('-k', dest='speculate', type='int', default=3,
+    help='fetch details of the first K foods of each page of search ' + \
+        'results before they are chosen (default: %default)')
+op.add_option('-c', dest='cache', default=None,
+    help='cache FatSecret API responses in the specified local database, ' + \
+        'and look them up there first')
+op.add_option('-J', dest='journal', default=None,
+    help='record each resolved ingredient in the specified journal file, ' + \
+        'and skip ingredients already recorded there')
+op.add_option('-m', dest='mapping', default=None,
+    help='look up ingredients in the specified food mapping file before ' + \
+        'searching for them, and add the foods chosen to it')
 op.add_option('-v', dest='verbosity', action='count', default=0,
     help='increase verbosity; can be used multiple times')
 
@@ -54,6 +75,8 @@ if len(args) < 1:
 if len(args) < 2:
     op.error('secret key expected')
 fs = fatsecret.FatSecret(args[0], args[1])
+if opts.cache:
+    fs = nutrition.TieredBackend(fs, nutrition.LocalBackend(opts.cache))
 
 if len(args) < 3:
     op.error('ingredients file expected')
@@ -65,26 +88,71 @@ servings = int(args[3])
 
 ifile = codecs.getreader('utf-8')(sys.stdin)
 
-# Read lines from our recipe file and record the nutrient information for each
-# in the 'nutrients' dictinoary
-nutrients = {}
+page_sz = 10
+
+pool = ThreadPool(max(opts.threads, 1))
+demand_pool = ThreadPool(1)
+prefetcher = prefetch.Prefetcher(
+    fs, pool, demand_pool, page_sz, opts.speculate)
+
+jrnl = journal.Journal(opts.journal) if opts.journal else None
+foods_map = mapping.FoodMapping(opts.mapping) if opts.mapping else None
+
+# Parse every line up front and start searching for all of the ingredients so
+# that results are ready by the time we prompt for them
+ingredients = []
 for l in f.readlines():
     l = l.strip()
     q, i = recipe.parse_ingredient(l)
+    ingredients += [(l, q, i)]
+
+    if jrnl and jrnl.get(l):
+        continue
+
+    m = foods_map.match(i) if foods_map else None
+    if m:
+        prefetcher.prefetch_food(m[0])
+    if not m or m[1] != mapping.normalize_name(i):
+        # Fuzzy matches have to be confirmed, and might not be
+        prefetcher.prefetch_search(i, 0)
+
+# Read lines from our recipe file and record the nutrient information for each
+# in the 'nutrients' dictinoary
+nutrients = {}
+for l, q, i in ingredients:
     unit, value = q
 
     # Display the food that we're searching for
     print '<< ' + l
 
-    # Paginate through search results, waiting for the user to select a result
-    # for us (or run out of results and abort)
-    page_no = 0
-    page_sz = 10
+    # Skip anything that we've already resolved
+    if jrnl and jrnl.get(l):
+        print '   (food %s from journal)' % jrnl.get(l)['food_id']
+        nutrients[l] = jrnl.get(l)['nutrition']
+        continue
 
-    foods = fs.foods_search(
-        search_expression=i, page_number=page_no, max_results=page_sz)['foods']
+    # Use the food that we chose for this ingredient before, if any. A food
+    # chosen for a similar ingredient might not be right (e.g. salted butter
+    # for unsalted butter), so ask first.
     food_id = None
-    while True:
+    m = foods_map.match(i) if foods_map else None
+    if m and m[1] == mapping.normalize_name(i):
+        print '   (food %s from mapping for "%s")' % m
+        food_id = m[0]
+    elif m:
+        sys.stdout.write(
+            '   Use food %s from mapping for "%s"? [Y/n] ' % m)
+        if sys.stdin.readline().strip().lower() in ('', 'y'):
+            food_id = m[0]
+        else:
+            m = None
+
+    # Otherwise paginate through search results, waiting for the user to
+    # select a result for us (or run out of results and abort)
+    page_no = 0
+    if food_id is None:
+        foods = prefetcher.search(i, page_no)
+    while food_id is None:
         assert 'food' in foods, \
             'Could not find any more results for ' + i
 
@@ -109,17 +177,27 @@ for l in f.readlines():
 
         if cl == 'n':
             page_no += 1
-            foods = fs.foods_search(
-                search_expression=i, page_number=page_no,
-                max_results=page_sz)['foods']
+            foods = prefetcher.search(i, page_no)
         else:
             assert False, 'Unknown command: ' + cl
 
-    n = recipe.get_food_nutrition(unit, value, food_id, fs)
+    n = recipe.get_serving_nutrition(
+        unit, value, prefetcher.food_get(food_id))
     assert n != None, \
         'failed to convert i=%s, food_id=%s' % (i, food_id)
 
     nutrients[l] = n
+    if jrnl:
+        jrnl.record(l, food_id, n)
+    # Only remember foods chosen from search results; similar ingredients
+    # aren't exact matches
+    if foods_map and not m:
+        foods_map.put(i, food_id)
+        foods_map.save()
+
+# Abandon any speculative fetches that are still outstanding
+pool.terminate()
+demand_pool.terminate()
 
 # Compute the aggregate nutritional values across all ingredients
 total_nutrients = {}
@@ -0,0 +1,231 @@
+#!/bin/env python
+#
+# Benchmark the end-to-end nutrition pipeline against replayed FatSecret
+# responses:
+#
+#   ingredient text -> parse_ingredient -> foods_search -> food_get ->
+#   get_serving_nutrition -> aggregation
+#
+# Recipes of various sizes are built from the ingredient lines below (all of
+# which have recorded responses in the default fixture) and run with
+# different degrees of concurrency. Per-stage latency percentiles, throughput
+# and allocation counts are written as JSON so that results can be compared
+# between releases.
+#
+# Allocations are measured as the net number of objects tracked by the
+# garbage collector (i.e. containers) created while computing a recipe; Python
+# 2 offers no cheaper way to count raw allocations.
+
+import gc
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+from optparse import OptionParser
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path += [
+    os.path.join(os.path.dirname(sys.modules[__name__].__file__), '..', 'lib')]
+
+from homnivore import fatsecret
+from homnivore import instrument
+from homnivore import recipe
+from homnivore import replay
+
+# Ingredient lines that have responses in the default fixture
+INGREDIENT_LINES = [
+    u'1 clove garlic',
+    u'4 cloves garlic, thinly sliced',
+    u'2 tbsp olive oil',
+    u'1 medium onion, diced',
+    u'4 oz butter (1 stick)',
+    u'2 cups chicken broth',
+    u'1 tsp salt',
+    u'\u00bd tsp black pepper',
+    u'2 cups all-purpose flour',
+    u'1 cup sugar',
+    u'2 large eggs',
+    u'2 tbsp lemon juice',
+    u'1 lb chicken breast']
+
+# Pipeline stages, in order
+STAGES = ['parse', 'foods_search', 'food_get', 'scale', 'aggregate']
+
+DEFAULT_FIXTURE = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__), '..', 'lib', 'homnivore',
+    'test', 'fixtures', 'fatsecret.json')
+
+
+def summarize(values):
+    values = sorted(values)
+
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': instrument.percentile(values, 50),
+        'p90': instrument.percentile(values, 90),
+        'p99': instrument.percentile(values, 99),
+        'max': values[-1] if values else None}
+
+
+def process_line(l, fs):
+    '''
+    Compute nutrition for a single ingredient line, returning the nutrient
+    dictionary and a dictionary of the time spent in each stage.
+    '''
+
+    timings = {}
+
+    t = time.time()
+    q, i = recipe.parse_ingredient(l)
+    unit, value = q
+    timings['parse'] = time.time() - t
+
+    t = time.time()
+    foods = fs.foods_search(search_expression=i)['foods']['food']
+    if type(foods) != list:
+        foods = [foods]
+    timings['foods_search'] = time.time() - t
+
+    t = time.time()
+    food = fs.food_get(food_id=foods[0]['food_id'])
+    timings['food_get'] = time.time() - t
+
+    t = time.time()
+    n = recipe.get_serving_nutrition(unit, value, food)
+    timings['scale'] = time.time() - t
+
+    assert n != None, 'failed to convert ' + l
+
+    return n, timings
+
+
+def run_recipe(lines, fs, pool):
+    '''
+    Compute total nutrition for a recipe, returning a dictionary of results.
+    '''
+
+    gc.collect()
+    gc.disable()
+    try:
+        allocs = gc.get_count()[0]
+        start = time.time()
+
+        results = pool.map(lambda l: process_line(l, fs), lines)
+
+        t = time.time()
+        nutrition = {}
+        for n, _ in results:
+            for k, v in n.iteritems():
+                nutrition[k] = nutrition.get(k, 0.0) + v
+        aggregate = time.time() - t
+
+        wall = time.time() - start
+        allocs = gc.get_count()[0] - allocs
+    finally:
+        gc.enable()
+
+    stages = dict((s, [timings[s] for _, timings in results]) \
+        for s in STAGES if s != 'aggregate')
+    stages['aggregate'] = [aggregate]
+
+    return {
+        'lines': len(lines),
+        'wall': wall,
+        'lines_per_second': len(lines) / wall if wall > 0 else None,
+        'net_gc_allocations': allocs,
+        'stages': stages}
+
+
+op = OptionParser(
+    usage='%prog [options]',
+    description='''Benchmark the nutrition pipeline against a replayed
+FatSecret corpus and write the results as JSON.''')
+op.add_option('-f', dest='fixture', default=DEFAULT_FIXTURE,
+    help='replay FatSecret responses from the specified fixture file ' + \
+        '(default: %default)')
+op.add_option('-s', dest='sizes', default='5,10,25',
+    help='comma-separated list of recipe sizes, in lines ' + \
+        '(default: %default)')
+op.add_option('-c', dest='concurrency', default='1,4,8',
+    help='comma-separated list of concurrency levels (default: %default)')
+op.add_option('-n', dest='recipes', type='int', default=5,
+    help='number of recipes to run for each size and concurrency level ' + \
+        '(default: %default)')
+op.add_option('-l', dest='latency', type='float', default=0.01,
+    help='seconds of latency to inject per API call (default: %default)')
+op.add_option('-j', dest='jitter', type='float', default=0.0,
+    help='maximum seconds of random latency to add per API call ' + \
+        '(default: %default)')
+op.add_option('--coalesce', dest='coalesce', action='store_true',
+    default=False, help='coalesce concurrent identical API calls')
+op.add_option('-o', dest='outfile', default='-',
+    help='write results to the specified file (default: %default)')
+op.add_option('-v', dest='verbosity', action='count', default=0,
+    help='increase verbosity; can be used multiple times')
+
+opts, args = op.parse_args()
+
+logging.basicConfig(
+    stream=sys.stderr,
+    format='%(message)s',
+    level=logging.CRITICAL - opts.verbosity * 10)
+
+fs = fatsecret.FatSecret(transport=replay.ReplayTransport(
+    opts.fixture, latency=opts.latency, jitter=opts.jitter))
+if opts.coalesce:
+    fs = fatsecret.CoalescingFatSecret(fs)
+
+# Use a fixed seed so that runs are comparable
+rand = random.Random(0)
+
+results = []
+for size in [int(x) for x in opts.sizes.split(',')]:
+    for concurrency in [int(x) for x in opts.concurrency.split(',')]:
+        pool = ThreadPool(concurrency)
+
+        recipes = []
+        for _ in range(opts.recipes):
+            lines = [rand.choice(INGREDIENT_LINES) for _ in range(size)]
+            recipes += [run_recipe(lines, fs, pool)]
+
+        pool.close()
+        pool.join()
+
+        stages = {}
+        for s in STAGES:
+            stages[s] = summarize(sum([r['stages'][s] for r in recipes], []))
+
+        for r in recipes:
+            r['stages'] = dict(
+                (s, summarize(v)) for s, v in r['stages'].iteritems())
+
+        wall = sorted(r['wall'] for r in recipes)
+        logging.info('size=%d concurrency=%d: p50 %.4fs/recipe' % \
+            (size, concurrency, instrument.percentile(wall, 50)))
+
+        results += [{
+            'recipe_size': size,
+            'concurrency': concurrency,
+            'recipe_wall': summarize(wall),
+            'lines_per_second': sum(r['lines'] for r in recipes) / sum(wall),
+            'stages': stages,
+            'recipes': recipes}]
+
+ofile = sys.stdout if opts.outfile == '-' else open(opts.outfile, 'w')
+json.dump({
+        'format_version': 1,
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'config': {
+            'fixture': os.path.basename(opts.fixture),
+            'recipes': opts.recipes,
+            'latency': opts.latency,
+            'jitter': opts.jitter,
+            'coalesce': opts.coalesce},
+        'results': results},
+    ofile, indent=4, sort_keys=True)
+ofile.write('\n')
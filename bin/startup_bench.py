@@ -0,0 +1,150 @@
+#!/bin/env python
+#
+# Benchmark the cold-start cost of each route of the web app: the time taken
+# to import main.py (which every request pays for on a new instance) and then
+# to import the route's handler and everything it depends on (which the first
+# request for the route pays for). Each measurement is taken in a fresh
+# interpreter, since imports are only slow once. Results are written as JSON so
+# that they can be compared between releases.
+#
+# The App Engine SDK must be importable, either by being on the PYTHONPATH
+# already or by naming its directory with -s.
+
+import json
+import logging
+from optparse import OptionParser
+import os
+import platform
+import subprocess
+import sys
+import time
+
+GAE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(sys.modules[__name__].__file__)), '..',
+    'gae')
+LIB_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(sys.modules[__name__].__file__)), '..',
+    'lib')
+
+
+def summarize(values):
+    values = sorted(values)
+
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': instrument.percentile(values, 50),
+        'p90': instrument.percentile(values, 90),
+        'max': values[-1] if values else None}
+
+
+def setup_path(sdk):
+    sys.path.insert(0, GAE_DIR)
+    if sdk:
+        sys.path.insert(0, sdk)
+        import dev_appserver
+        dev_appserver.fix_sys_path()
+
+
+def measure(handler, sdk):
+    '''
+    Import main.py and then the given handler, returning a dictionary of the
+    time taken by each and the number of modules loaded. Only meaningful in a
+    fresh interpreter.
+    '''
+
+    setup_path(sdk)
+    modules = len(sys.modules)
+
+    start = time.time()
+    import main
+    main_seconds = time.time() - start
+    main_modules = len(sys.modules) - modules
+
+    import webapp2
+    start = time.time()
+    webapp2.import_string(handler)
+    handler_seconds = time.time() - start
+
+    return {
+        'main_seconds': main_seconds,
+        'main_modules': main_modules,
+        'handler_seconds': handler_seconds,
+        'handler_modules': len(sys.modules) - modules - main_modules}
+
+
+op = OptionParser(
+    usage='%prog [options]',
+    description='''Benchmark the import time of the web app and of each of
+its routes' handlers and write the results as JSON.''')
+op.add_option('-s', dest='sdk', default=None,
+    help='directory of the App Engine SDK')
+op.add_option('-n', dest='runs', type='int', default=5,
+    help='number of runs for each route (default: %default)')
+op.add_option('-o', dest='outfile', default='-',
+    help='write results to the specified file (default: %default)')
+op.add_option('-v', dest='verbosity', action='count', default=0,
+    help='increase verbosity; can be used multiple times')
+op.add_option('--child', dest='child', default=None,
+    help='(internal) measure the given handler and print the result')
+
+opts, args = op.parse_args()
+
+logging.basicConfig(
+    stream=sys.stderr,
+    format='%(message)s',
+    level=logging.CRITICAL - opts.verbosity * 10)
+
+if opts.child:
+    json.dump(measure(opts.child, opts.sdk), sys.stdout)
+    sys.exit(0)
+
+# Only import from homnivore here, once we know that this isn't a run being
+# measured
+sys.path += [LIB_DIR]
+from homnivore import instrument
+
+# Get the routes in a separate interpreter, so as not to import anything here
+# that the runs should be measuring
+cmd = [sys.executable, '-c',
+    'import sys; sys.path.insert(0, %r); ' % GAE_DIR +
+    (('sys.path.insert(0, %r); import dev_appserver; ' +
+        'dev_appserver.fix_sys_path(); ') % opts.sdk if opts.sdk else '') +
+    'import json, main; json.dump(main.ROUTES, sys.stdout)']
+routes = json.loads(subprocess.check_output(cmd))
+
+results = []
+for route, handler in routes:
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', handler]
+    if opts.sdk:
+        cmd += ['-s', opts.sdk]
+
+    runs = []
+    for _ in range(opts.runs):
+        runs += [json.loads(subprocess.check_output(cmd))]
+
+    main_seconds = [r['main_seconds'] for r in runs]
+    handler_seconds = [r['handler_seconds'] for r in runs]
+    total = [m + h for m, h in zip(main_seconds, handler_seconds)]
+    logging.info('%s: p50 %.4fs to first request' % \
+        (route, instrument.percentile(sorted(total), 50)))
+
+    results += [{
+        'route': route,
+        'handler': handler,
+        'main_seconds': summarize(main_seconds),
+        'handler_seconds': summarize(handler_seconds),
+        'total_seconds': summarize(total),
+        'main_modules': runs[0]['main_modules'],
+        'handler_modules': runs[0]['handler_modules']}]
+
+ofile = sys.stdout if opts.outfile == '-' else open(opts.outfile, 'w')
+json.dump({
+        'format_version': 1,
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'config': {
+            'runs': opts.runs},
+        'results': results},
+    ofile, indent=4, sort_keys=True)
+ofile.write('\n')
@@ -0,0 +1,167 @@
+'''
+Code shared by all handlers.
+
+This is imported by main.py for every request, so it should import as little
+as possible; anything heavy belongs in the modules that need it, which are
+only loaded when a route that uses them is first requested.
+'''
+
+from google.appengine.api import users
+import gzip
+import hashlib
+from homnivore import instrument
+import os
+import StringIO
+import webapp2
+
+# The Jinja environment; created on first use by get_jinja_env()
+_jinja_env = None
+
+
+def login_required(f):
+    '''
+    Decorator to indicate that the given function requires a logged-in user.
+    This should be applied to get()/post()/etc methods in RequestHandler
+    objects.
+    '''
+
+    def wrapper_f(self, *args, **kwargs):
+        if not users.get_current_user():
+            self.redirect(users.create_login_url(self.request.url))
+            return
+
+        f(self, *args, **kwargs)
+
+    return wrapper_f
+
+
+def get_jinja_env():
+    global _jinja_env
+    if _jinja_env is None:
+        import templates
+        _jinja_env = templates.create_environment()
+
+    return _jinja_env
+
+
+def load_templates():
+    '''
+    Load and compile all templates ahead of their first use.
+    '''
+
+    import templates
+    env = get_jinja_env()
+    for name in templates.template_names():
+        env.get_template(name)
+
+
+def render_template(path, **kwargs):
+    '''
+    Render a temlate at the given path, creating a dictionary out of
+    the specified keyword arguemnts.
+    '''
+
+    ctx = {}
+    if users.get_current_user():
+        ctx['logout_url'] = users.create_logout_url('/')
+    else:
+        ctx['login_url'] = users.create_login_url('/')
+
+    ctx.update(kwargs)
+
+    with instrument.timer('render_template.' + path):
+        return get_jinja_env().get_template(path).render(ctx)
+
+
+def parse_etags(header):
+    '''
+    Return the set of entity tags (without quotes or weakness indicators) in
+    an If-None-Match header.
+    '''
+
+    etags = set()
+    for e in header.split(','):
+        e = e.strip()
+        if e.startswith('W/'):
+            e = e[2:]
+        etags.add(e.strip('"'))
+
+    return etags
+
+
+class BaseHandler(webapp2.RequestHandler):
+    '''
+    Base class for all of our handlers. Tags each request with a trace ID
+    (taken from the App Engine trace header if present) and times it.
+    Responses are gzipped if the client accepts it.
+    '''
+
+    # Content types worth compressing, and the smallest body to bother with
+    GZIP_TYPES = ('text/html', 'application/json')
+    GZIP_MIN_SIZE = 512
+
+    def dispatch(self):
+        trace_id = self.request.headers.get('X-Cloud-Trace-Context', '')
+        trace_id = trace_id.split('/')[0] or instrument.new_trace_id()
+
+        instrument.set_trace_id(trace_id)
+        self.response.headers['X-Trace-Id'] = trace_id
+        try:
+            with instrument.timer('request.' + self.__class__.__name__):
+                rv = webapp2.RequestHandler.dispatch(self)
+                self.compress()
+                return rv
+        finally:
+            instrument.set_trace_id(None)
+
+    def compress(self):
+        r = self.response
+        content_type = r.headers.get('Content-Type', '').split(';')[0]
+        if r.status_int not in (200, 202) or \
+                content_type not in self.GZIP_TYPES or \
+                'Content-Encoding' in r.headers:
+            return
+
+        r.headers['Vary'] = 'Accept-Encoding'
+        if 'gzip' not in self.request.headers.get('Accept-Encoding', '') or \
+                len(r.body) < self.GZIP_MIN_SIZE:
+            return
+
+        with instrument.timer('gzip'):
+            buf = StringIO.StringIO()
+            f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6)
+            f.write(r.body)
+            f.close()
+
+        r.body = buf.getvalue()
+        r.headers['Content-Encoding'] = 'gzip'
+
+    def not_modified(self, *parts):
+        '''
+        Set a (weak) ETag for the response computed from the given parts,
+        which should identify everything that the response depends on, and
+        return True if the client's copy is current, in which case the
+        response is a 304 and nothing else should be done. The user and the
+        deployed version of the app are included automatically.
+
+        Responses are marked as private and to be revalidated on each use, so
+        a repeat view costs a round trip but no rendering or transfer.
+        '''
+
+        user = users.get_current_user()
+        parts = [
+            os.environ.get('CURRENT_VERSION_ID', ''),
+            user.user_id() if user else ''] + list(parts)
+        etag = hashlib.sha1('\0'.join(
+            unicode(p).encode('utf-8') for p in parts)).hexdigest()
+
+        self.response.headers['ETag'] = 'W/"%s"' % etag
+        self.response.headers['Cache-Control'] = 'private, no-cache'
+
+        if etag in parse_etags(self.request.headers.get('If-None-Match', '')):
+            self.response.set_status(304)
+            return True
+
+        return False
+
+# vim: ts=4 sw=4
@@ -0,0 +1,176 @@
+'''
+Handlers for scraping and clipping recipes.
+'''
+
+from base import BaseHandler, login_required, render_template
+from google.appengine.api import users
+from google.appengine.ext import db
+from homnivore import clips
+from homnivore import content
+from homnivore import jobs
+from homnivore.models import Recipe, ScrapeJob
+from homnivore.scrape import can_scrape
+import json
+import logging
+from urlparse import urlparse
+
+
+def get_scrape_job(key):
+    '''
+    Return the ScrapeJob with the given key if it belongs to the current user,
+    or None. A job that has been pending for too long is marked as failed, so
+    that clients stop polling it.
+    '''
+
+    try:
+        job = ScrapeJob.get(db.Key(key))
+    except db.BadKeyError:
+        return None
+
+    if not job or job.user_id != users.get_current_user().user_id():
+        return None
+
+    return jobs.expire_scrape(job)
+
+
+class ClipHandler(BaseHandler):
+    '''
+    Handler that scrapes a recipe for the user to confirm clipping. A GET
+    fetches the page at 'url' itself; a POST (from the bookmarklet) extracts
+    the recipe from the page's 'html' as sent by the browser, which saves
+    downloading it again.
+
+    Either way, scraping is queued as a ScrapeJob and the user is redirected
+    to /clip?job=<key>, which refreshes itself until the job has run.
+    '''
+
+    @login_required
+    def get(self):
+        if self.request.get('job'):
+            self.show_job(self.request.get('job'))
+            return
+
+        self.start(self.request.get('url'))
+
+    @login_required
+    def post(self):
+        self.start(self.request.get('url'), self.request.get('html'))
+
+    def start(self, url, html=None):
+        if not can_scrape(url):
+            logging.info('No scraper for ' + url)
+            self.response.out.write(
+                render_template('clip.html', recipe=None, url=urlparse(url)))
+            return
+
+        job = jobs.start_scrape(
+            url, users.get_current_user().user_id(), html=html or None)
+        self.redirect('/clip?job=' + str(job.key()), code=303)
+
+    def show_job(self, key):
+        job = get_scrape_job(key)
+        if not job:
+            self.error(404)
+            return
+
+        recipe = None
+        token = None
+        if job.status == ScrapeJob.DONE:
+            recipe = job.get_recipe()
+            token = clips.put_clip(recipe)
+        elif job.status == ScrapeJob.FAILED:
+            logging.info('Failed to scrape %s: %s' % (job.url, job.error))
+
+        self.response.out.write(
+            render_template('clip.html',
+                pending=job.status == ScrapeJob.PENDING,
+                recipe=recipe,
+                token=token,
+                url=urlparse(job.url)))
+
+
+class AddHandler(BaseHandler):
+    '''
+    API handler that adds a recipe, given either the token of a clip (see
+    ClipHandler) or a JSON blob describing it.
+    '''
+
+    @login_required
+    def post(self):
+        token = self.request.get('token')
+        if token:
+            recipe = clips.take_clip(token)
+            if not recipe:
+                # Expired; the user will have to clip it again
+                self.error(410)
+                return
+        else:
+            recipe = Recipe.from_json(self.request.get('recipe'))
+
+        # Make sure nobody tries to write to someone else's stream
+        if recipe.user_id != users.get_current_user().user_id():
+            self.error(400)
+            return
+
+        content.share_content(recipe)
+        recipe.put()
+
+
+class ScrapeHandler(BaseHandler):
+    '''
+    API handler that queues scraping a URL, returning 202 and a JSON blob with
+    the 'job' key to poll ScrapeJobHandler with. If the page's 'html' is
+    POSTed, the recipe is extracted from that rather than by fetching the URL.
+    '''
+
+    @login_required
+    def get(self):
+        self.start(self.request.get('url'))
+
+    @login_required
+    def post(self):
+        self.start(self.request.get('url'), self.request.get('html'))
+
+    def start(self, url, html=None):
+        if not can_scrape(url):
+            logging.info('No scraper for ' + url)
+            self.error(400)
+            return
+
+        job = jobs.start_scrape(
+            url, users.get_current_user().user_id(), html=html or None)
+
+        self.response.set_status(202)
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.out.write(json.dumps({
+            'job': str(job.key()),
+            'status': job.status}))
+
+
+class ScrapeJobHandler(BaseHandler):
+    '''
+    API handler that returns the state of a scrape job as a JSON blob with a
+    'status' of 'pending', 'done' (with the 'recipe') or 'failed' (with the
+    'error').
+    '''
+
+    @login_required
+    def get(self):
+        job = get_scrape_job(self.request.get('id'))
+        if not job:
+            self.error(404)
+            return
+
+        if self.not_modified('job', job.key(), job.status, job.updated):
+            return
+
+        o = {'status': job.status}
+        if job.recipe:
+            o['recipe'] = json.loads(job.recipe)
+        if job.error:
+            o['error'] = job.error
+
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.out.write(json.dumps(o))
+
+# vim: ts=4 sw=4
@@ -1,49 +1,26 @@
+from base import BaseHandler, load_templates, render_template
 from google.appengine.api import users
-from google.appengine.ext import db
-from homnivore.models import Recipe
-from homnivore.scrape import scrape
-import jinja2
-import json
+from homnivore import instrument
 import logging
 import os
-from urlparse import urlparse
 import webapp2
 
-def login_required(f):
-    '''
-    Decorator to indicate that the given function requires a logged-in user.
-    This should be applied to get()/post()/etc methods in RequestHandler
-    objects.
-    '''
-
-    def wrapper_f(self, *args, **kwargs):
-        if not users.get_current_user():
-            self.redirect(users.create_login_url(self.request.url))
-            return
-
-        f(self, *args, **kwargs)
-
-    return wrapper_f
-
-
-def render_template(path, **kwargs):
-    '''
-    Render a temlate at the given path, creating a dictionary out of
-    the specified keyword arguemnts.
-    '''
-
-    ctx = {}
-    if users.get_current_user():
-        ctx['logout_url'] = users.create_logout_url('/')
-    else:
-        ctx['login_url'] = users.create_login_url('/')
-
-    ctx.update(kwargs)
-
-    return jinja_env.get_template(path).render(ctx)
-
-
-class MainHandler(webapp2.RequestHandler):
+# Routes and their handlers. Handlers other than those defined here are named
+# rather than imported, so that webapp2 only imports a handler's module (and
+# whatever it depends on) when its route is first requested.
+ROUTES = [
+    ('/', 'main.MainHandler'),
+    ('/_ah/warmup', 'main.WarmupHandler'),
+    ('/list', 'pages.ListHandler'),
+    ('/view', 'pages.ViewHandler'),
+    ('/clip', 'clipping.ClipHandler'),
+    ('/api/scrape', 'clipping.ScrapeHandler'),
+    ('/api/scrape/job', 'clipping.ScrapeJobHandler'),
+    ('/api/add', 'clipping.AddHandler'),
+    ('/api/nutrition', 'nutrition_api.NutritionHandler')]
+
+
+class MainHandler(BaseHandler):
     def get(self):
         if users.get_current_user():
             self.redirect('/list')
@@ -52,86 +29,41 @@ class MainHandler(webapp2.RequestHandler):
         self.response.out.write(render_template('main.html'))
 
 
-class ListHandler(webapp2.RequestHandler):
-    def get(self):
-        recipes = Recipe.all()
-        recipes.filter('user_id = ', users.get_current_user().user_id())
-        tmpl = jinja_env.get_template('list.html')
-        self.response.out.write(
-            render_template('list.html',
-                recipes=recipes,
-                base_url=self.request.host_url))
-
-
-class ClipHandler(webapp2.RequestHandler):
-    @login_required
-    def get(self):
-        url = self.request.get('url')
-        recipe = scrape(url=url, user_id=users.get_current_user().user_id())
-        if not recipe:
-            logging.info('Failed to scrape ' + url)
-        self.response.out.write(
-            render_template('clip.html',
-                recipe=recipe,
-                url=urlparse(url)))
-
-
-class ViewHandler(webapp2.RequestHandler):
-    @login_required
-    def get(self):
-        key = db.Key(self.request.get('id'))
-        recipe = Recipe.get(key)
-        self.response.out.write(
-            render_template('view.html',
-                recipe=recipe))
-
-
-class AddHandler(webapp2.RequestHandler):
+class WarmupHandler(BaseHandler):
     '''
-    API handler that adds a recipe described by a JSON blob.
+    Handler for App Engine warmup requests (see app.yaml), which are sent to
+    new instances before they serve traffic. Loads everything that the first
+    requests and jobs would otherwise have to: every handler's module, the
+    nutrition stack used by jobs (compiling the ingredient parser's regular
+    expressions along the way), the templates and the scrapers' XPath
+    expressions.
     '''
 
-    @login_required
-    def post(self):
-        recipe = Recipe.from_json(self.request.get('recipe'))
-       
-        # Make sure nobody tries to write to someone else's stream
-        if recipe.user_id != users.get_current_user().user_id():
-            self.error(400)
-            return
-
-        recipe.put()
-
+    def get(self):
+        with instrument.timer('warmup.handlers'):
+            for _, handler in ROUTES:
+                webapp2.import_string(handler)
 
-class ScrapeHandler(webapp2.RequestHandler):
-    '''
-    API handler that scrapes a URL and returns the found recipe as a JSON blob.
-    '''
+        with instrument.timer('warmup.nutrition'):
+            for name in ('homnivore.recipe', 'homnivore.fatsecret',
+                    'homnivore.nutrition'):
+                webapp2.import_string(name)
 
-    @login_required
-    def get(self):
-        url = self.request.get('url')
+        with instrument.timer('warmup.templates'):
+            load_templates()
 
-        recipe = scrape(url=url, user_id=users.get_current_user().user_id())
-        if not recipe:
-            logging.info('Failed to scrape ' + url)
-            self.error(400)
-            return
+        from homnivore import scrape
+        with instrument.timer('warmup.scrape'):
+            scrape.warm()
 
-        self.response.headers['Content-Type'] = 'application/json'
-        self.response.out.write(recipe.to_json())
+        logging.info('Warmed up')
 
 
-app = webapp2.WSGIApplication([
-        ('/', MainHandler),
-        ('/list', ListHandler),
-        ('/clip', ClipHandler),
-        ('/view', ViewHandler),
-        ('/api/scrape', ScrapeHandler),
-        ('/api/add', AddHandler)],
-    debug=True)
+app = webapp2.WSGIApplication(ROUTES, debug=True)
 
-jinja_env = jinja2.Environment(
-    loader=jinja2.FileSystemLoader(os.path.dirname(__file__)))
+# Instrumentation is off unless a sink is named in the environment (see
+# app.yaml)
+instrument.configure(
+    instrument.sink_from_name(os.environ.get('HOMNIVORE_INSTRUMENT')))
 
 # vim: ts=4 sw=4
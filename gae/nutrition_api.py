@@ -0,0 +1,82 @@
+'''
+Handlers for computing the nutrition of recipes.
+'''
+
+from base import BaseHandler, login_required
+from google.appengine.api import users
+from google.appengine.ext import db
+from homnivore import jobs
+from homnivore import tasks
+from homnivore.models import NutritionResult, Recipe
+import json
+
+
+class NutritionHandler(BaseHandler):
+    '''
+    API handler for the nutrition of a stored recipe. POSTing starts computing
+    it in the background; GET returns the result so far as a JSON blob with a
+    'status' of 'pending', 'done' or 'failed'.
+    '''
+
+    def get_recipe(self):
+        try:
+            recipe = Recipe.get(db.Key(self.request.get('id')))
+        except db.BadKeyError:
+            recipe = None
+
+        if not recipe or recipe.user_id != users.get_current_user().user_id():
+            self.error(404)
+            return None
+
+        return recipe
+
+    def write_result(self, result):
+        o = {
+            'status': result.status,
+            'servings': result.servings}
+        if result.nutrition:
+            o['nutrition'] = json.loads(result.nutrition)
+        if result.error:
+            o['error'] = result.error
+
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.out.write(json.dumps(o))
+
+    @login_required
+    def get(self):
+        recipe = self.get_recipe()
+        if not recipe:
+            return
+
+        result = NutritionResult.get(NutritionResult.key_for(recipe.key()))
+        if not result:
+            self.error(404)
+            return
+
+        self.write_result(result)
+
+    @login_required
+    def post(self):
+        recipe = self.get_recipe()
+        if not recipe:
+            return
+
+        try:
+            servings = max(int(self.request.get('servings', 1)), 1)
+        except ValueError:
+            self.error(400)
+            return
+
+        # Only record that the computation is pending and queue it, so that
+        # this takes the same time however many ingredients there are
+        result = NutritionResult(
+            key=NutritionResult.key_for(recipe.key()),
+            status=NutritionResult.PENDING,
+            servings=servings)
+        result.put()
+        tasks.defer(jobs.compute_nutrition, str(recipe.key()), servings)
+
+        self.response.set_status(202)
+        self.write_result(result)
+
+# vim: ts=4 sw=4
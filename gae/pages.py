@@ -0,0 +1,55 @@
+'''
+Handlers for browsing clipped recipes.
+'''
+
+from base import BaseHandler, login_required, render_template
+from google.appengine.api import users
+from google.appengine.ext import db
+from homnivore import content
+from homnivore.models import Recipe
+
+
+class ListHandler(BaseHandler):
+    def get(self):
+        user_id = users.get_current_user().user_id()
+
+        # The query is only eventually consistent, so the ETag is made from
+        # the recipes that it actually found, and the page rendered from
+        # exactly those
+        keys = Recipe.all(keys_only=True)
+        keys.filter('user_id = ', user_id)
+        keys = list(keys)
+        if self.not_modified(
+                'list', self.request.host_url, len(keys),
+                ','.join(str(k) for k in keys)):
+            return
+
+        recipes = [r for r in db.get(keys) if r]
+        self.response.out.write(
+            render_template('list.html',
+                recipes=content.prefetch_content(recipes),
+                base_url=self.request.host_url))
+
+
+class ViewHandler(BaseHandler):
+    @login_required
+    def get(self):
+        try:
+            recipe = Recipe.get(db.Key(self.request.get('id')))
+        except db.BadKeyError:
+            recipe = None
+
+        if not recipe:
+            self.error(404)
+            return
+
+        if self.not_modified(
+                'view', recipe.key(), recipe.name,
+                content.content_version(recipe)):
+            return
+
+        self.response.out.write(
+            render_template('view.html',
+                recipe=recipe))
+
+# vim: ts=4 sw=4
@@ -0,0 +1,83 @@
+'''
+Jinja template environment.
+
+In production, templates are served from Python modules precompiled at
+deploy time (run this file to compile them) and are never re-checked for
+changes on disk. On the development server, or if no compiled templates are
+present, templates are loaded from source and auto-reloaded as usual.
+'''
+
+import jinja2
+import os
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPILED_TEMPLATE_DIR = os.path.join(TEMPLATE_DIR, 'templates_compiled')
+
+
+class _ChoiceLoader(jinja2.ChoiceLoader):
+    '''
+    A ChoiceLoader that can be used with a ModuleLoader, which has no source
+    to offer. Jinja 2.6's ChoiceLoader only loads via get_source().
+    '''
+
+    def load(self, environment, name, globals=None):
+        for loader in self.loaders:
+            try:
+                return loader.load(environment, name, globals)
+            except jinja2.TemplateNotFound:
+                pass
+
+        raise jinja2.TemplateNotFound(name)
+
+
+def is_template(name):
+    '''
+    Whether or not the given path (relative to TEMPLATE_DIR) is one of our
+    templates, as opposed to a static file.
+    '''
+
+    return name.endswith('.html') and '/' not in name
+
+
+def template_names():
+    '''
+    Return the names of all of our templates.
+    '''
+
+    return sorted(n for n in os.listdir(TEMPLATE_DIR) if is_template(n))
+
+
+def is_production():
+    return not os.environ.get('SERVER_SOFTWARE', '').startswith('Development')
+
+
+def create_environment():
+    '''
+    Create the Jinja environment appropriate for where we're running.
+    '''
+
+    if is_production() and os.path.isdir(COMPILED_TEMPLATE_DIR):
+        # Fall back to the sources in case a template was added without
+        # being compiled
+        return jinja2.Environment(
+            loader=_ChoiceLoader([
+                jinja2.ModuleLoader(COMPILED_TEMPLATE_DIR),
+                jinja2.FileSystemLoader(TEMPLATE_DIR)]),
+            auto_reload=False)
+
+    return jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATE_DIR))
+
+
+def compile_templates():
+    '''
+    Compile all templates to Python modules in COMPILED_TEMPLATE_DIR.
+    '''
+
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATE_DIR))
+    env.compile_templates(
+        COMPILED_TEMPLATE_DIR, filter_func=is_template, zip=None,
+        ignore_errors=False)
+
+
+if __name__ == '__main__':
+    compile_templates()
@@ -0,0 +1,44 @@
+'''
+Scraped recipes waiting to be clipped.
+
+When a recipe is scraped for clipping, it is held in memcache under an opaque
+token for a short while, so that confirming the clip only needs to send the
+token back rather than the whole recipe.
+'''
+
+from google.appengine.api import memcache
+import uuid
+
+# How long, in seconds, a scraped recipe is held for
+CLIP_TTL = 30 * 60
+
+_NAMESPACE = 'clips'
+
+
+def put_clip(recipe):
+    '''
+    Hold the given (unsaved) Recipe, returning its token.
+    '''
+
+    token = uuid.uuid4().hex
+    memcache.set(token, recipe, time=CLIP_TTL, namespace=_NAMESPACE)
+    return token
+
+
+def take_clip(token):
+    '''
+    Return the Recipe held under the given token, or None if there isn't one
+    (e.g. because it expired). The token can't be used again.
+    '''
+
+    recipe = memcache.get(token, namespace=_NAMESPACE)
+    if recipe is None:
+        return None
+
+    # Only the request that manages to delete the token gets the recipe, so
+    # that submitting a clip twice doesn't add it twice
+    if memcache.delete(token, namespace=_NAMESPACE) != \
+            memcache.DELETE_SUCCESSFUL:
+        return None
+
+    return recipe
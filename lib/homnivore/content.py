@@ -0,0 +1,165 @@
+'''
+Recipe content shared between users.
+
+Many users clip the same popular recipes, so rather than each Recipe holding
+its own copy of the ingredients and steps, the scraped content is stored once
+as a RecipeContent keyed by a hash of the content, and Recipes reference it.
+A RecipeSource records the content last scraped from each canonical URL, so
+that clipping a URL that was scraped recently doesn't need to scrape it again.
+
+Only content that the server scraped from a page it fetched itself is shared.
+Anything a client supplied (the page HTML sent by the bookmarklet, or a recipe
+POSTed to the API) could be made up, so it stays in the user's own Recipe,
+unless it happens to be identical to trusted content.
+'''
+
+import datetime
+from google.appengine.ext import db
+import hashlib
+import json
+from .models import Recipe, RecipeContent, RecipeSource
+import urllib
+from urlparse import parse_qsl, urlsplit, urlunsplit
+
+# How long, in seconds, scraped content is used for before its URL is scraped
+# again
+CONTENT_TTL = 7 * 24 * 60 * 60
+
+# Prefixes of query parameters that don't affect the content of a page
+_IGNORED_PARAMS = ('utm_',)
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonical_url(url):
+    '''
+    Normalize a URL so that different ways of writing the URL of the same page
+    compare equal: lower-case the scheme and hostname, drop the default port,
+    the fragment and any tracking parameters, and sort the query.
+    '''
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    netloc = (parts.hostname or '').lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        netloc += ':%d' % parts.port
+
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) \
+            if not k.startswith(_IGNORED_PARAMS))
+
+    return urlunsplit(
+        (scheme, netloc, parts.path or '/', urllib.urlencode(query), ''))
+
+
+def content_hash(recipe):
+    '''
+    Return a hash of the content (i.e. everything but the user and URL) of an
+    unsaved Recipe.
+    '''
+
+    s = json.dumps(
+        [recipe.name, recipe.ingredients, recipe.steps, recipe.image],
+        sort_keys=True)
+    return hashlib.sha1(s).hexdigest()
+
+
+def content_version(recipe):
+    '''
+    Return a string that changes whenever the content of the given Recipe
+    does, without fetching shared content.
+    '''
+
+    key = Recipe.content.get_value_for_datastore(recipe)
+    if key:
+        return key.name()
+
+    return content_hash(recipe)
+
+
+def get_fresh_content(url):
+    '''
+    Return the RecipeContent scraped from the given URL within CONTENT_TTL, or
+    None if there isn't one.
+    '''
+
+    source = RecipeSource.get_by_key_name(canonical_url(url))
+    if not source:
+        return None
+
+    age = datetime.datetime.utcnow() - source.scraped
+    if age > datetime.timedelta(seconds=CONTENT_TTL):
+        return None
+
+    return source.content
+
+
+def recipe_from_content(content, url, user_id):
+    '''
+    Construct an unsaved Recipe for the given user from shared content, as
+    though it had been scraped from the given URL.
+    '''
+
+    return Recipe(
+        user_id=user_id, url=url, name=content.name,
+        ingredients=content.ingredients, steps=content.steps,
+        image=content.image)
+
+
+def record_scrape(recipe):
+    '''
+    Record an unsaved Recipe that the server just scraped from a page it
+    fetched itself as the latest content of its URL, returning the
+    RecipeContent. Never call this for content that a client supplied.
+    '''
+
+    key_name = content_hash(recipe)
+    content = RecipeContent.get_by_key_name(key_name)
+    if not content:
+        # Racing to create the same content is harmless, as it's identical
+        content = RecipeContent(
+            key_name=key_name, url=canonical_url(recipe.url),
+            name=recipe.name, ingredients=recipe.ingredients,
+            steps=recipe.steps, image=recipe.image)
+        content.put()
+
+    RecipeSource(key_name=canonical_url(recipe.url), content=content).put()
+    return content
+
+
+def share_content(recipe):
+    '''
+    If the content of an unsaved Recipe has been scraped by the server (see
+    record_scrape()), replace the Recipe's copy with a reference to the shared
+    RecipeContent. Otherwise the Recipe keeps its own copy. Either way, it
+    still needs to be put().
+    '''
+
+    content = RecipeContent.get_by_key_name(content_hash(recipe))
+    if not content:
+        return recipe
+
+    recipe.content = content
+    recipe.ingredients = []
+    recipe.steps = []
+    recipe.image = None
+    return recipe
+
+
+def prefetch_content(recipes):
+    '''
+    Fetch the content of the given stored Recipes in a single batch, rather
+    than one at a time as each is read. Returns the Recipes as a list.
+    '''
+
+    recipes = list(recipes)
+    keys = [Recipe.content.get_value_for_datastore(r) for r in recipes]
+
+    contents = dict(
+        (c.key(), c) for c in db.get([k for k in keys if k]) if c)
+    for r, k in zip(recipes, keys):
+        if k in contents:
+            r.content = contents[k]
+
+    return recipes
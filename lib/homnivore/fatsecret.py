@@ -4,29 +4,73 @@ Wrapper around the FatSecret REST API
 http://platform.fatsecret.com/api/
 '''
 
+import instrument
 import json
 import oauth2
+import sys
+import threading
 import urllib
 
+class OAuthTransport(object):
+    '''
+    Transport that sends API calls to a FatSecret REST endpoint, signed with
+    OAuth.
+
+    Transports have a single request() method that takes a dictionary of
+    request parameters and returns the raw (JSON) response body.
+    '''
+
+    def __init__(self, consumerKey, secretKey,
+            endpoint='http://platform.fatsecret.com/rest/server.api'):
+        self.consumer = oauth2.Consumer(consumerKey, secretKey)
+        self.endpoint = endpoint
+
+        # The underlying httplib2 connections are not safe to share between
+        # threads, so each thread gets its own OAuth client
+        self._local = threading.local()
+
+    @property
+    def oaClient(self):
+        if not hasattr(self._local, 'oaClient'):
+            self._local.oaClient = oauth2.Client(self.consumer)
+
+        return self._local.oaClient
+
+    def request(self, params):
+        head, body = self.oaClient.request(
+            uri=self.endpoint,
+            method='POST',
+            body=urllib.urlencode(params))
+
+        return body
+
+
 class FatSecret(object):
 
-    _REST_ENDPOINT = 'http://platform.fatsecret.com/rest/server.api'
-    
-    def __init__(self, consumerKey, secretKey):
-        self.oaClient = oauth2.Client(oauth2.Consumer(consumerKey, secretKey))
+    def __init__(self, consumerKey=None, secretKey=None, transport=None):
+        '''
+        Create a new API wrapper. By default calls are sent to FatSecret
+        using the given keys. Alternatively, an explicit transport object can
+        be specified (e.g. to replay recorded responses), in which case the
+        keys are not used.
+        '''
+
+        if transport is None:
+            transport = OAuthTransport(consumerKey, secretKey)
+
+        self.transport = transport
 
     def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
         def wrapper_f(**kwargs):
             kwargs.update({
                 'method': name.replace('_', '.'),
                 'format': 'json'})
 
-            head, body = self.oaClient.request(
-                uri=self._REST_ENDPOINT,
-                method='POST',
-                body=urllib.urlencode(kwargs))
-            
-            body = json.loads(body)
+            with instrument.timer('fatsecret.' + name):
+                body = json.loads(self.transport.request(kwargs))
 
             if 'error' in body:
                 raise FatSecretError(
@@ -45,6 +89,106 @@ class FatSecretError(Exception):
         self.message = message
 
 
+def normalize_kwargs(kwargs):
+    '''
+    Normalize the keyword arguments for an API call into a hashable, sorted
+    tuple of (name, value) pairs.
+
+    Values are converted to the string form that urllib.urlencode() would put
+    on the wire, so that e.g. page_number=0 and page_number='0' are considered
+    the same call.
+    '''
+
+    def norm_value(v):
+        if isinstance(v, unicode):
+            return v.encode('utf-8')
+
+        return str(v)
+
+    return tuple(sorted((k, norm_value(v)) for k, v in kwargs.iteritems()))
+
+
+class _InFlightCall(object):
+    '''
+    A single outstanding API call that other threads can wait on.
+    '''
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CoalescingFatSecret(object):
+    '''
+    Wrapper around a FatSecret object that coalesces concurrent identical API
+    calls into a single outbound request (a.k.a. single-flight).
+
+    If a thread invokes a method with the same name and normalized keyword
+    arguments as a call that is already in progress, it blocks until that call
+    completes and shares its parsed result (or exception) rather than issuing
+    a request of its own. Nothing is retained once a call completes; this is
+    not a cache.
+
+    Callers share the returned objects, so they must not mutate them.
+    '''
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.lock = threading.Lock()
+        self.calls = {}
+
+        # Number of calls made to the underlying object and number of calls
+        # that were satisfied by waiting on one of those
+        self.requests = 0
+        self.coalesced = 0
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        def wrapper_f(**kwargs):
+            key = (name, normalize_kwargs(kwargs))
+
+            self.lock.acquire()
+            try:
+                call = self.calls.get(key, None)
+                leader = call is None
+                if leader:
+                    call = self.calls[key] = _InFlightCall()
+                    self.requests += 1
+                else:
+                    self.coalesced += 1
+            finally:
+                self.lock.release()
+
+            if not leader:
+                instrument.incr('fatsecret.coalesced.' + name)
+                call.event.wait()
+                if call.error:
+                    raise call.error[0], call.error[1], call.error[2]
+
+                return call.result
+
+            try:
+                call.result = getattr(self.fs, name)(**kwargs)
+            except:
+                call.error = sys.exc_info()
+                raise
+            finally:
+                self.lock.acquire()
+                try:
+                    del self.calls[key]
+                finally:
+                    self.lock.release()
+
+                call.event.set()
+
+            return call.result
+
+        return wrapper_f
+
+
 def units_for_nutrient(n):
     '''
     Get the units for the given nutrient.
@@ -76,7 +220,6 @@ def units_for_nutrient(n):
 
 if __name__ == '__main__':
     from optparse import OptionParser
-    import sys
 
     op = OptionParser(
         usage='%prog [options] <consumer-key> <secret-key> <method>',
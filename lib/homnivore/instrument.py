@@ -0,0 +1,242 @@
+'''
+Optional timers and counters for hot paths.
+
+Instrumentation is disabled until a sink is installed with configure(); until
+then timer(), timed() and incr() cost little more than a global lookup. Each
+measurement is tagged with the current thread's trace ID, if any, so that
+measurements can be tied back to the request that caused them.
+'''
+
+import logging
+import math
+import socket
+import threading
+import time
+import uuid
+
+# The installed sink; None if instrumentation is disabled
+_sink = None
+
+# Per-thread state (i.e. the trace ID)
+_local = threading.local()
+
+
+def configure(sink):
+    '''
+    Install the given sink, or disable instrumentation if it is None.
+    '''
+
+    global _sink
+    _sink = sink
+
+
+def sink_from_name(name):
+    '''
+    Create a sink from its name, for use in configuration: 'logging',
+    'statsd' or 'memory'. Returns None for an empty name.
+    '''
+
+    if not name:
+        return None
+
+    sinks = {
+        'logging': LoggingSink,
+        'statsd': StatsdSink,
+        'memory': MemorySink}
+
+    if name not in sinks:
+        raise ValueError('unknown instrumentation sink ' + repr(name))
+
+    return sinks[name]()
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def set_trace_id(trace_id):
+    _local.trace_id = trace_id
+
+
+def get_trace_id():
+    return getattr(_local, 'trace_id', None)
+
+
+def incr(name, count=1):
+    '''
+    Increment the named counter.
+    '''
+
+    if _sink is None:
+        return
+
+    _sink.incr(name, count, get_trace_id())
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+
+    def __init__(self, sink, name):
+        self.sink = sink
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sink.timing(self.name, time.time() - self.start, get_trace_id())
+        return False
+
+
+def timer(name):
+    '''
+    Return a context manager that records the time spent in its body under
+    the given name.
+    '''
+
+    if _sink is None:
+        return _NULL_TIMER
+
+    return _Timer(_sink, name)
+
+
+def timed(name):
+    '''
+    Decorator that records the time spent in each call of the decorated
+    function under the given name.
+    '''
+
+    def decorator_f(f):
+        def wrapper_f(*args, **kwargs):
+            sink = _sink
+            if sink is None:
+                return f(*args, **kwargs)
+
+            start = time.time()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                sink.timing(name, time.time() - start, get_trace_id())
+
+        wrapper_f.__name__ = f.__name__
+        wrapper_f.__doc__ = f.__doc__
+        return wrapper_f
+
+    return decorator_f
+
+
+def percentile(values, pct):
+    '''
+    Return the given percentile of a sorted list of values using the
+    nearest-rank method, or None if the list is empty.
+    '''
+
+    if not values:
+        return None
+
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+###############################################################################
+# Sinks
+#
+# Each sink implements timing(name, seconds, trace_id) and incr(name, count,
+# trace_id). These may be called concurrently from multiple threads.
+###############################################################################
+class LoggingSink(object):
+    '''
+    Writes each measurement to a logger.
+    '''
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('homnivore.instrument')
+        self.level = level
+
+    def timing(self, name, seconds, trace_id):
+        self.logger.log(
+            self.level, '[%s] %s: %.2fms', trace_id, name, seconds * 1000)
+
+    def incr(self, name, count, trace_id):
+        self.logger.log(self.level, '[%s] %s: +%d', trace_id, name, count)
+
+
+class StatsdSink(object):
+    '''
+    Sends each measurement to a statsd daemon over UDP. Trace IDs are not
+    sent, as statsd has no place to put them. Send failures are ignored.
+    '''
+
+    def __init__(self, host='localhost', port=8125, prefix='homnivore.'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, data):
+        try:
+            self.sock.sendto(data, self.address)
+        except socket.error:
+            pass
+
+    def timing(self, name, seconds, trace_id):
+        self.send('%s%s:%d|ms' % (self.prefix, name, int(seconds * 1000)))
+
+    def incr(self, name, count, trace_id):
+        self.send('%s%s:%d|c' % (self.prefix, name, count))
+
+
+class MemorySink(object):
+    '''
+    Accumulates measurements in memory, e.g. for tests or to print a summary
+    at the end of a command-line run.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        # Map of name to list of (seconds, trace_id) tuples
+        self.timings = {}
+
+        # Map of name to total count
+        self.counters = {}
+
+    def timing(self, name, seconds, trace_id):
+        self.lock.acquire()
+        try:
+            self.timings.setdefault(name, []).append((seconds, trace_id))
+        finally:
+            self.lock.release()
+
+    def incr(self, name, count, trace_id):
+        self.lock.acquire()
+        try:
+            self.counters[name] = self.counters.get(name, 0) + count
+        finally:
+            self.lock.release()
+
+    def summary(self):
+        '''
+        Return a human-readable summary of all measurements.
+        '''
+
+        lines = []
+        for name, ts in sorted(self.timings.iteritems()):
+            total = sum(t for t, _ in ts)
+            lines += ['%s: %d calls, %.2fms total, %.2fms mean' % \
+                (name, len(ts), total * 1000, total * 1000 / len(ts))]
+
+        for name, count in sorted(self.counters.iteritems()):
+            lines += ['%s: %d' % (name, count)]
+
+        return '\n'.join(lines)
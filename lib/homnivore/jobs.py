@@ -0,0 +1,217 @@
+'''
+Background jobs, run from a task queue (see tasks.py).
+
+The handlers that queue jobs import this module, so the nutrition stack
+(FatSecret, the nutrition backends and the ingredient parser) is only imported
+by the jobs that use it.
+'''
+
+import datetime
+from google.appengine.ext import db
+from . import content
+from . import instrument
+from . import tasks
+from .models import NutritionResult, Recipe, ScrapeJob
+from .scrape import scrape, scrape_html
+import httplib2
+import json
+import logging
+import os
+import urllib2
+
+# Errors that are worth retrying a job for
+TRANSIENT_ERRORS = (IOError, httplib2.HttpLib2Error)
+
+# The largest page HTML, in bytes once encoded, that is stored with a
+# ScrapeJob; entities are limited to 1MB in all. The URL of a larger page is
+# fetched instead.
+MAX_HTML_SIZE = 512 * 1024
+
+# How many times to try scraping a page that fails with a transient error
+MAX_SCRAPE_ATTEMPTS = 5
+
+# How long, in seconds, a scrape job may stay pending (e.g. if its task was
+# lost) before it is given up on
+SCRAPE_TIMEOUT = 10 * 60
+
+# The nutrition backend for jobs on this instance; created on first use
+_backend = None
+
+
+def get_backend():
+    '''
+    Return the nutrition backend for jobs to use: FatSecret, with the
+    credentials from the environment (see app.yaml), behind an in-process
+    cache that is shared by all jobs on this instance.
+    '''
+
+    global _backend
+    if _backend is None:
+        from .fatsecret import FatSecret
+        from .nutrition import TieredBackend
+
+        _backend = TieredBackend(FatSecret(
+            os.environ.get('FS_CONSUMER_KEY'),
+            os.environ.get('FS_SECRET_KEY')))
+
+    return _backend
+
+
+def set_backend(backend):
+    '''
+    Use the given nutrition backend for jobs, e.g. for testing. If it is None,
+    get_backend() creates the default backend again.
+    '''
+
+    global _backend
+    _backend = backend
+
+
+def compute_nutrition(recipe_key, servings=1):
+    '''
+    Compute nutrition for the recipe with the given key and store it in its
+    NutritionResult. Transient errors are raised, so that the task queue
+    retries the job; anything else marks the result as failed.
+    '''
+
+    from .recipe import RecipeNutrition
+
+    recipe = Recipe.get(db.Key(recipe_key))
+    if recipe is None:
+        logging.info('Recipe %s was deleted before its nutrition was computed' \
+            % recipe_key)
+        return
+
+    result = NutritionResult(
+        key=NutritionResult.key_for(recipe.key()), servings=servings)
+
+    try:
+        with instrument.timer('jobs.compute_nutrition'):
+            n = RecipeNutrition(get_backend()).compute(
+                recipe.get_ingredients(), servings)
+    except TRANSIENT_ERRORS:
+        raise
+    except Exception, e:
+        logging.exception('Failed to compute nutrition for ' + recipe_key)
+        result.status = NutritionResult.FAILED
+        result.error = unicode(e)[:500]
+    else:
+        result.status = NutritionResult.DONE
+        result.nutrition = db.Text(json.dumps(n))
+
+    result.put()
+
+
+def start_scrape(url, user_id, html=None):
+    '''
+    Create a ScrapeJob for the given URL (and, optionally, the page's HTML)
+    and queue scrape_recipe() for it, returning the job. If there is fresh
+    shared content for the URL, the job is done immediately. HTML larger than
+    MAX_HTML_SIZE is dropped, so that the URL is fetched instead.
+    '''
+
+    # If the URL was scraped recently, there's no need to do so again, or even
+    # to queue the job
+    c = content.get_fresh_content(url)
+    if c:
+        recipe = content.recipe_from_content(c, url, user_id)
+        job = ScrapeJob(
+            user_id=user_id, url=url, status=ScrapeJob.DONE,
+            recipe=db.Text(recipe.to_json()))
+        job.put()
+        return job
+
+    if html and len(html.encode('utf-8')) > MAX_HTML_SIZE:
+        logging.info('Fetching %s rather than storing %d characters of HTML' \
+            % (url, len(html)))
+        html = None
+
+    job = ScrapeJob(user_id=user_id, url=url, html=html)
+    job.put()
+    tasks.defer(scrape_recipe, str(job.key()))
+    return job
+
+
+def scrape_recipe(job_key):
+    '''
+    Run the ScrapeJob with the given key, storing the scraped recipe in it.
+    Transient errors (e.g. the site timing out) are raised, so that the task
+    queue retries the job, until MAX_SCRAPE_ATTEMPTS have been made; anything
+    else marks the job as failed.
+    '''
+
+    job = ScrapeJob.get(db.Key(job_key))
+    if job is None or job.status != ScrapeJob.PENDING:
+        return
+
+    try:
+        with instrument.timer('jobs.scrape_recipe'):
+            if job.html:
+                recipe = scrape_html(
+                    url=job.url, html=job.html, user_id=job.user_id)
+            else:
+                recipe = scrape(url=job.url, user_id=job.user_id)
+    except urllib2.HTTPError, e:
+        # HTTPError is an IOError, but only server errors are worth retrying
+        if e.code >= 500 and _retry_scrape(job, e):
+            raise
+        job.status = ScrapeJob.FAILED
+        job.error = unicode(e)[:500]
+    except TRANSIENT_ERRORS, e:
+        if _retry_scrape(job, e):
+            raise
+        job.status = ScrapeJob.FAILED
+        job.error = unicode(e)[:500]
+    except Exception, e:
+        logging.exception('Failed to scrape ' + job.url)
+        job.status = ScrapeJob.FAILED
+        job.error = unicode(e)[:500]
+    else:
+        if recipe:
+            # Only share what we fetched ourselves; the user's browser could
+            # have sent anything
+            if not job.html:
+                content.record_scrape(recipe)
+            job.status = ScrapeJob.DONE
+            job.recipe = db.Text(recipe.to_json())
+        else:
+            job.status = ScrapeJob.FAILED
+            job.error = u'No recipe found'
+
+    job.html = None
+    job.put()
+
+
+def _retry_scrape(job, e):
+    '''
+    Record a failed attempt at a ScrapeJob, returning whether it should be
+    retried (by re-raising the exception) or given up on.
+    '''
+
+    job.attempts += 1
+    if job.attempts >= MAX_SCRAPE_ATTEMPTS:
+        logging.info('Giving up scraping %s after %d attempts: %s' % \
+            (job.url, job.attempts, e))
+        return False
+
+    job.put()
+    return True
+
+
+def expire_scrape(job):
+    '''
+    Mark the given ScrapeJob as failed if it has been pending for longer than
+    SCRAPE_TIMEOUT, returning it.
+    '''
+
+    if job.status != ScrapeJob.PENDING or job.created is None:
+        return job
+
+    age = datetime.datetime.utcnow() - job.created
+    if age > datetime.timedelta(seconds=SCRAPE_TIMEOUT):
+        job.status = ScrapeJob.FAILED
+        job.error = u'Timed out'
+        job.html = None
+        job.put()
+
+    return job
@@ -0,0 +1,80 @@
+'''
+Journal of resolved ingredient lines.
+
+Each time an ingredient line is resolved to a food and its nutrition computed,
+the result is appended to the journal file as a line of JSON and flushed to
+disk. If a run is interrupted, re-running it with the same journal picks up
+where it left off; and since the journal is keyed only by the ingredient line,
+it can be shared between recipes so that lines seen before never need to be
+searched for again.
+'''
+
+import codecs
+import json
+import logging
+import os
+
+
+def line_key(l):
+    '''
+    Normalize an ingredient line for lookup in the journal.
+    '''
+
+    return u' '.join(l.lower().split())
+
+
+class Journal(object):
+
+    def __init__(self, path):
+        self.path = path
+
+        # Map of line key to the most recent entry for it
+        self.entries = {}
+
+        # Whether the file ends part of the way through an entry
+        torn = False
+
+        if os.path.exists(path):
+            f = codecs.open(path, 'r', encoding='utf-8')
+            try:
+                for n, l in enumerate(f):
+                    torn = not l.endswith(u'\n')
+                    try:
+                        e = json.loads(l)
+                    except ValueError:
+                        # Most likely a write that was interrupted
+                        logging.warning(
+                            '%s:%d: ignoring malformed entry' % (path, n + 1))
+                        continue
+
+                    self.entries[line_key(e['line'])] = e
+            finally:
+                f.close()
+
+        self.file = codecs.open(path, 'a', encoding='utf-8')
+        if torn:
+            self.file.write(u'\n')
+
+    def get(self, l):
+        '''
+        Return the entry for the given ingredient line, or None if it has not
+        been resolved. Entries are dictionaries with 'line', 'food_id' and
+        'nutrition' keys.
+        '''
+
+        return self.entries.get(line_key(l), None)
+
+    def record(self, l, food_id, nutrition):
+        '''
+        Record the resolution of the given ingredient line.
+        '''
+
+        e = {'line': l, 'food_id': food_id, 'nutrition': nutrition}
+        self.entries[line_key(l)] = e
+
+        self.file.write(json.dumps(e, sort_keys=True) + u'\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,146 @@
+'''
+Learned mapping of ingredient names to FatSecret foods.
+
+Ingredient names (the second element of parse_ingredient()'s result) repeat
+constantly between recipes, so once an ingredient has been resolved to a food,
+either by the user choosing it or by accepting the first search result, the
+choice is remembered here and later lookups don't need to search at all.
+
+Names are normalized before lookup, and only an exact match of normalized
+names (see get()) is safe to use without asking. match() also finds the
+closest known name that shares a word with the one being looked up, but as
+similar names can be different foods (e.g. 'unsalted butter' and 'salted
+butter'), its fuzzy matches are only suggestions: they should be confirmed by
+the user and must not be put() back as if they were exact.
+'''
+
+import difflib
+import json
+import re
+import threading
+
+# The minimum similarity (as computed by difflib) for a fuzzy match
+DEFAULT_CUTOFF = 0.85
+
+
+def normalize_name(name):
+    '''
+    Normalize an ingredient name: lower-case it, drop punctuation and naively
+    singularize each word.
+    '''
+
+    words = []
+    for w in re.split(r'[^\w]+', name.lower(), flags=re.UNICODE):
+        if not w:
+            continue
+
+        if len(w) > 3 and w.endswith('s') and not w.endswith('ss'):
+            w = w[:-1]
+
+        words += [w]
+
+    return u' '.join(words)
+
+
+class FoodMapping(object):
+    '''
+    A map of normalized ingredient name to food_id, optionally backed by a
+    JSON file.
+    '''
+
+    def __init__(self, path=None, cutoff=DEFAULT_CUTOFF):
+        self.path = path
+        self.cutoff = cutoff
+        self.lock = threading.Lock()
+
+        # Map of normalized name to food_id
+        self.foods = {}
+
+        # Map of word to the set of normalized names containing it
+        self.index = {}
+
+        if path:
+            try:
+                f = open(path, 'r')
+            except IOError:
+                pass
+            else:
+                try:
+                    for name, food_id in json.load(f).iteritems():
+                        self._add(name, food_id)
+                finally:
+                    f.close()
+
+    def _add(self, name, food_id):
+        self.foods[name] = food_id
+        for w in name.split():
+            self.index.setdefault(w, set()).add(name)
+
+    def get(self, name):
+        '''
+        Return the food_id for the given ingredient name, or None if it's not
+        known.
+        '''
+
+        return self.foods.get(normalize_name(name), None)
+
+    def match(self, name):
+        '''
+        Like get(), but falls back to the most similar known name. Returns a
+        (food_id, matched name) tuple, or None if nothing is similar enough.
+        A matched name other than normalize_name(name) is only a suggestion.
+        '''
+
+        name = normalize_name(name)
+        if name in self.foods:
+            return (self.foods[name], name)
+
+        self.lock.acquire()
+        try:
+            candidates = set()
+            for w in name.split():
+                candidates.update(self.index.get(w, ()))
+        finally:
+            self.lock.release()
+
+        best = None
+        sm = difflib.SequenceMatcher()
+        sm.set_seq2(name)
+        for c in sorted(candidates):
+            sm.set_seq1(c)
+            if sm.real_quick_ratio() < self.cutoff or \
+                    sm.quick_ratio() < self.cutoff:
+                continue
+
+            r = sm.ratio()
+            if r >= self.cutoff and (best is None or r > best[0]):
+                best = (r, c)
+
+        if best is None:
+            return None
+
+        return (self.foods[best[1]], best[1])
+
+    def put(self, name, food_id):
+        '''
+        Remember that the given ingredient name refers to food_id.
+        '''
+
+        self.lock.acquire()
+        try:
+            self._add(normalize_name(name), food_id)
+        finally:
+            self.lock.release()
+
+    def save(self):
+        self.lock.acquire()
+        try:
+            foods = dict(self.foods)
+        finally:
+            self.lock.release()
+
+        f = open(self.path, 'w')
+        try:
+            json.dump(foods, f, indent=4, sort_keys=True)
+        finally:
+            f.close()
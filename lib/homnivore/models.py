@@ -70,7 +70,9 @@ class _BaseModel(db.Model):
 
             prop = props[name]
 
-            if isinstance(val, prop.data_type):
+            if val is None and not prop.required:
+                continue
+            elif isinstance(val, prop.data_type):
                 kwargs[name] = val
             else:
                 raise ValueError('cannot decode ' + repr(val))
@@ -78,10 +80,127 @@ class _BaseModel(db.Model):
         return cls(**kwargs)
 
 
-class Recipe(_BaseModel):
-    user_id = db.StringProperty(required=True)
+class RecipeContent(_BaseModel):
+    '''
+    Scraped recipe content shared by every Recipe with the same content (see
+    content.py). The key name is a hash of the content.
+    '''
+
+    # The canonical URL the content was first scraped from
     url = db.StringProperty(required=True)
     name = db.StringProperty(required=True)
     ingredients = db.StringListProperty(required=True)
     steps = db.StringListProperty(required=True)
     image = db.StringProperty(required=False)
+
+
+class RecipeSource(db.Model):
+    '''
+    The content most recently scraped from a URL. The key name is the
+    canonical URL.
+    '''
+
+    content = db.ReferenceProperty(RecipeContent, required=True)
+    scraped = db.DateTimeProperty(auto_now=True)
+
+
+class Recipe(_BaseModel):
+    '''
+    A recipe clipped by a user. Stored recipes reference their (shared)
+    content rather than holding it themselves, so ingredients, steps and image
+    should be read with get_ingredients() etc, which work either way.
+    '''
+
+    user_id = db.StringProperty(required=True)
+    url = db.StringProperty(required=True)
+    name = db.StringProperty(required=True)
+    ingredients = db.StringListProperty(required=False)
+    steps = db.StringListProperty(required=False)
+    image = db.StringProperty(required=False)
+    content = db.ReferenceProperty(RecipeContent, required=False)
+
+    def _get_content(self):
+        # Don't dereference (i.e. fetch) the content unless there is some
+        if Recipe.content.get_value_for_datastore(self) is None:
+            return self
+
+        return self.content
+
+    def get_ingredients(self):
+        return self._get_content().ingredients
+
+    def get_steps(self):
+        return self._get_content().steps
+
+    def get_image(self):
+        return self._get_content().image
+
+
+class NutritionResult(_BaseModel):
+    '''
+    Nutrition computed in the background for a Recipe, which is its parent.
+    Each recipe has at most one, with the key name 'nutrition'.
+    '''
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    status = db.StringProperty(
+        required=True, choices=(PENDING, DONE, FAILED), default=PENDING)
+    servings = db.IntegerProperty(required=True, default=1)
+
+    # JSON-encoded {'lines': [...], 'total': {...}, 'per_serving': {...}}, as
+    # computed by recipe.RecipeNutrition, once status is DONE
+    nutrition = db.TextProperty(required=False)
+
+    # Why the computation failed, if status is FAILED
+    error = db.StringProperty(required=False)
+
+    updated = db.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def key_for(cls, recipe_key):
+        return db.Key.from_path(cls.kind(), 'nutrition', parent=recipe_key)
+
+
+class ScrapeJob(_BaseModel):
+    '''
+    A request to scrape a recipe in the background (see jobs.scrape_recipe()),
+    and its result.
+    '''
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    user_id = db.StringProperty(required=True)
+    url = db.StringProperty(required=True)
+    status = db.StringProperty(
+        required=True, choices=(PENDING, DONE, FAILED), default=PENDING)
+
+    # The page as sent by the user's browser, if any, in which case the URL is
+    # not fetched. Cleared once the job has run.
+    html = db.TextProperty(required=False)
+
+    # The scraped Recipe, serialized with to_json(), once status is DONE
+    recipe = db.TextProperty(required=False)
+
+    # Why scraping failed, if status is FAILED
+    error = db.StringProperty(required=False)
+
+    # How many times scraping has failed with a transient error
+    attempts = db.IntegerProperty(required=True, default=0)
+
+    created = db.DateTimeProperty(auto_now_add=True)
+    updated = db.DateTimeProperty(auto_now=True)
+
+    def get_recipe(self):
+        '''
+        Return the scraped (unsaved) Recipe, or None if there isn't one yet.
+        '''
+
+        if not self.recipe:
+            return None
+
+        return Recipe.from_json(self.recipe)
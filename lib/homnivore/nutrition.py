@@ -0,0 +1,454 @@
+'''
+Sources of nutrition information.
+
+A nutrition backend is any object with the foods_search() and food_get()
+methods of FatSecret, returning the same (decoded JSON) structures:
+
+    foods_search(search_expression, page_number=0, max_results=20)
+    food_get(food_id)
+
+FatSecret itself is one such backend. LocalBackend is another, which serves
+foods from an SQLite database bulk-imported from a dump file, so that batch
+jobs can run without the network. TieredBackend puts an in-process cache and a
+LocalBackend in front of another backend (i.e. FatSecret), so that lookups
+only leave the machine the first time.
+
+Dump files contain one JSON object per line, each being the 'food' element of
+a FatSecret food.get response (i.e. with 'food_id', 'food_name', 'food_type'
+and 'servings'), optionally with a 'food_description'. FatSecret fixture files
+(see replay.py) can be imported as well.
+'''
+
+import collections
+from fatsecret import FatSecretError, normalize_kwargs
+import json
+import logging
+from mapping import normalize_name
+import sqlite3
+import threading
+import time
+
+# The FatSecret error code for an unknown food_id
+INVALID_ID = 106
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS foods (
+    food_id TEXT PRIMARY KEY,
+    food_name TEXT NOT NULL,
+    food_type TEXT,
+    food_description TEXT);
+
+CREATE TABLE IF NOT EXISTS servings (
+    food_id TEXT NOT NULL,
+    serving_id TEXT,
+    serving TEXT NOT NULL);
+
+CREATE INDEX IF NOT EXISTS servings_food_id ON servings (food_id);
+
+CREATE TABLE IF NOT EXISTS words (
+    word TEXT NOT NULL,
+    food_id TEXT NOT NULL,
+    PRIMARY KEY (word, food_id));
+
+CREATE TABLE IF NOT EXISTS searches (
+    params TEXT PRIMARY KEY,
+    response TEXT NOT NULL);
+'''
+
+
+def describe_food(food):
+    '''
+    Generate a FatSecret-style description of a food from its first serving,
+    e.g. 'Per 1 clove - Calories: 4kcal | Fat: 0.02g | Carbs: 0.99g |
+    Protein: 0.19g'.
+    '''
+
+    serving = food['servings']['serving']
+    if type(serving) == list:
+        serving = serving[0]
+
+    return 'Per %s - Calories: %dkcal | Fat: %.2fg | Carbs: %.2fg | ' \
+        'Protein: %.2fg' % (
+            serving['serving_description'],
+            float(serving.get('calories', 0)),
+            float(serving.get('fat', 0)),
+            float(serving.get('carbohydrate', 0)),
+            float(serving.get('protein', 0)))
+
+
+class LocalBackend(object):
+    '''
+    A nutrition backend that serves foods from an SQLite database.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+        # SQLite connections can't be shared between threads
+        self._local = threading.local()
+
+        self.db.executescript(_SCHEMA)
+
+    @property
+    def db(self):
+        if not hasattr(self._local, 'db'):
+            self._local.db = sqlite3.connect(self.path)
+
+        return self._local.db
+
+    def foods_search(self, search_expression, page_number=0, max_results=20):
+        '''
+        Search for foods whose names contain every word of the search
+        expression, shortest (i.e. closest) names first.
+        '''
+
+        words = list(set(normalize_name(search_expression).split()))
+        page_number = int(page_number)
+        max_results = int(max_results)
+
+        foods = {
+            'max_results': str(max_results),
+            'page_number': str(page_number),
+            'total_results': '0'}
+
+        if not words:
+            return {'foods': foods}
+
+        matches = '''
+            SELECT food_id FROM words WHERE word IN (%s)
+            GROUP BY food_id HAVING COUNT(*) = ?''' % \
+            ', '.join('?' * len(words))
+        args = words + [len(words)]
+
+        total, = self.db.execute(
+            'SELECT COUNT(*) FROM (%s)' % matches, args).fetchone()
+        foods['total_results'] = str(total)
+
+        rows = self.db.execute('''
+            SELECT food_id, food_name, food_type, food_description
+            FROM foods WHERE food_id IN (%s)
+            ORDER BY LENGTH(food_name), food_name
+            LIMIT ? OFFSET ?''' % matches,
+            args + [max_results, page_number * max_results]).fetchall()
+        if rows:
+            foods['food'] = [{
+                    'food_id': food_id,
+                    'food_name': food_name,
+                    'food_type': food_type,
+                    'food_description': food_description} \
+                for food_id, food_name, food_type, food_description in rows]
+
+        return {'foods': foods}
+
+    def food_get(self, food_id):
+        row = self.db.execute('''
+            SELECT food_name, food_type FROM foods WHERE food_id = ?''',
+            (str(food_id),)).fetchone()
+        if row is None:
+            raise FatSecretError(
+                code=INVALID_ID, message='Invalid ID: ' + str(food_id))
+
+        servings = [json.loads(s) for s, in self.db.execute('''
+            SELECT serving FROM servings WHERE food_id = ? ORDER BY rowid''',
+            (str(food_id),))]
+
+        return {
+            'food': {
+                'food_id': str(food_id),
+                'food_name': row[0],
+                'food_type': row[1],
+                'servings': {
+                    'serving': servings[0] if len(servings) == 1 \
+                        else servings}}}
+
+    def put(self, food, description=None):
+        '''
+        Add a food (the 'food' element of a food.get response) to the
+        database, replacing any existing food with the same food_id. Changes
+        are not committed until commit() is called.
+        '''
+
+        food_id = str(food['food_id'])
+        food_name = food['food_name']
+        description = description or food.get('food_description') or \
+            describe_food(food)
+
+        servings = food['servings']['serving']
+        if type(servings) != list:
+            servings = [servings]
+
+        db = self.db
+        db.execute('DELETE FROM servings WHERE food_id = ?', (food_id,))
+        db.execute('DELETE FROM words WHERE food_id = ?', (food_id,))
+        db.execute('''
+            INSERT OR REPLACE INTO foods
+            (food_id, food_name, food_type, food_description)
+            VALUES (?, ?, ?, ?)''',
+            (food_id, food_name, food.get('food_type'), description))
+        db.executemany('''
+            INSERT INTO servings (food_id, serving_id, serving)
+            VALUES (?, ?, ?)''',
+            [(food_id, s.get('serving_id'), json.dumps(s, sort_keys=True)) \
+                for s in servings])
+        db.executemany('''
+            INSERT OR IGNORE INTO words (word, food_id) VALUES (?, ?)''',
+            [(w, food_id) \
+                for w in set(normalize_name(food_name).split())])
+
+    def get_search(self, params):
+        '''
+        Return the cached foods_search() response of another backend for the
+        given keyword arguments, or None if there isn't one.
+        '''
+
+        row = self.db.execute(
+            'SELECT response FROM searches WHERE params = ?',
+            (json.dumps(normalize_kwargs(params)),)).fetchone()
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+    def put_search(self, params, response):
+        '''
+        Cache a foods_search() response of another backend. Changes are not
+        committed until commit() is called.
+        '''
+
+        self.db.execute(
+            'INSERT OR REPLACE INTO searches (params, response) VALUES (?, ?)',
+            (json.dumps(normalize_kwargs(params)), json.dumps(response)))
+
+    def commit(self):
+        self.db.commit()
+
+    def import_dump(self, f):
+        '''
+        Import foods from a dump file object, returning the number imported.
+        '''
+
+        n = 0
+        for ln, l in enumerate(f):
+            if not l.strip():
+                continue
+
+            try:
+                self.put(json.loads(l))
+            except (ValueError, KeyError), e:
+                logging.warning('line %d: skipping bad food: %s' % (ln + 1, e))
+                continue
+
+            n += 1
+
+        self.commit()
+        return n
+
+    def import_fixture(self, f):
+        '''
+        Import the foods from the food.get responses in a FatSecret fixture
+        file object (see replay.py), returning the number imported.
+        Descriptions are taken from any foods.search responses.
+        '''
+
+        entries = json.load(f)
+
+        descriptions = {}
+        for e in entries:
+            if e['params'].get('method') != 'foods.search':
+                continue
+
+            foods = e['response']['foods'].get('food', [])
+            if type(foods) != list:
+                foods = [foods]
+
+            for food in foods:
+                descriptions[food['food_id']] = food['food_description']
+
+        n = 0
+        for e in entries:
+            if e['params'].get('method') == 'food.get':
+                food = e['response']['food']
+                self.put(food, descriptions.get(food['food_id']))
+                n += 1
+
+        self.commit()
+        return n
+
+
+class _TierStats(object):
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def summary(self):
+        # Failed lookups neither hit nor missed, but did take time
+        lookups = self.hits + self.misses
+        attempts = lookups + self.errors
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_ratio': float(self.hits) / lookups if lookups else None,
+            'mean_seconds': self.seconds / attempts if attempts else None}
+
+
+class TieredBackend(object):
+    '''
+    A nutrition backend that looks up foods and searches in an in-process LRU
+    cache, then a LocalBackend (if any), and only then the given remote
+    backend. Results are written back to the tiers that missed. Searches are
+    cached by their exact arguments rather than served by the LocalBackend's
+    own search, so that results are always those of the remote backend.
+
+    Cached results are shared between callers, who must not modify them.
+    '''
+
+    TIERS = ('lru', 'local', 'remote')
+
+    def __init__(self, remote, local=None, lru_size=1024):
+        self.remote = remote
+        self.local = local
+        self.lru_size = lru_size
+        self.lock = threading.Lock()
+
+        # Map of (method, normalized kwargs) to response, least recently used
+        # first
+        self.lru = collections.OrderedDict()
+
+        self.tiers = dict((t, _TierStats()) for t in self.TIERS)
+
+    def stats(self):
+        '''
+        Return a dictionary of hit ratios, error counts and mean lookup
+        latencies by tier.
+        '''
+
+        self.lock.acquire()
+        try:
+            return dict((t, s.summary()) for t, s in self.tiers.iteritems())
+        finally:
+            self.lock.release()
+
+    def _record(self, tier, hit, start, error=False):
+        self.lock.acquire()
+        try:
+            s = self.tiers[tier]
+            s.seconds += time.time() - start
+            if error:
+                s.errors += 1
+            elif hit:
+                s.hits += 1
+            else:
+                s.misses += 1
+        finally:
+            self.lock.release()
+
+    def _lru_get(self, key):
+        start = time.time()
+
+        self.lock.acquire()
+        try:
+            response = self.lru.pop(key, None)
+            if response is not None:
+                self.lru[key] = response
+        finally:
+            self.lock.release()
+
+        self._record('lru', response is not None, start)
+        return response
+
+    def _lru_put(self, key, response):
+        self.lock.acquire()
+        try:
+            self.lru[key] = response
+            while len(self.lru) > self.lru_size:
+                self.lru.popitem(last=False)
+        finally:
+            self.lock.release()
+
+    def _lookup(self, method, kwargs, local_get, local_put):
+        key = (method, normalize_kwargs(kwargs))
+
+        response = self._lru_get(key)
+        if response is not None:
+            return response
+
+        if self.local:
+            start = time.time()
+            response = local_get()
+            self._record('local', response is not None, start)
+
+        if response is None:
+            start = time.time()
+            try:
+                response = getattr(self.remote, method)(**kwargs)
+            except Exception:
+                self._record('remote', False, start, error=True)
+                raise
+            self._record('remote', True, start)
+
+            if self.local:
+                local_put(response)
+                self.local.commit()
+
+        self._lru_put(key, response)
+        return response
+
+    def foods_search(self, **kwargs):
+        return self._lookup(
+            'foods_search', kwargs,
+            lambda: self.local.get_search(kwargs),
+            lambda response: self.local.put_search(kwargs, response))
+
+    def food_get(self, food_id):
+        def local_get():
+            try:
+                return self.local.food_get(food_id=food_id)
+            except FatSecretError, e:
+                if e.code != INVALID_ID:
+                    raise
+                return None
+
+        return self._lookup(
+            'food_get', {'food_id': food_id}, local_get,
+            lambda response: self.local.put(response['food']))
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    import sys
+
+    op = OptionParser(
+        usage='%prog [options] <database> <dump> [<dump> ...]',
+        description='''Bulk-import foods from the given dump files into an
+SQLite database for use as a local nutrition backend. A dump of '-' is read
+from stdin.''')
+    op.add_option('-F', dest='fixture', action='store_true', default=False,
+        help='the dumps are FatSecret fixture files rather than food dumps')
+    op.add_option('-v', dest='verbosity', action='count', default=0,
+        help='increase verbosity; can be used multiple times')
+
+    opts, args = op.parse_args()
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        format='%(message)s',
+        level=logging.CRITICAL - opts.verbosity * 10)
+
+    if len(args) < 1:
+        op.error('no database specified')
+    if len(args) < 2:
+        op.error('no dump files specified')
+
+    backend = LocalBackend(args[0])
+    for path in args[1:]:
+        f = sys.stdin if path == '-' else open(path, 'r')
+        if opts.fixture:
+            n = backend.import_fixture(f)
+        else:
+            n = backend.import_dump(f)
+
+        print >> sys.stderr, 'Imported %d foods from %s' % (n, path)
@@ -0,0 +1,132 @@
+'''
+Background prefetching of FatSecret calls.
+'''
+
+import sys
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.result = None
+        self.started = False
+
+        # Set once the call has been made, with its value or exc_info
+        self.done = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+
+class Prefetcher(object):
+    '''
+    Makes FatSecret calls in the background ahead of their results being
+    needed, so that we don't wait on the network between prompts. Each call is
+    made at most once; its result (or exception) is kept until asked for.
+
+    Fetching a page of search results also starts fetching the details of its
+    first 'speculate' foods, as the user usually picks one of those.
+
+    Speculative calls run on 'pool'. Calls whose results are needed right away
+    run on 'demand_pool' instead, so that they never queue behind speculation;
+    whichever of the two runs of a call starts first makes it, and the other
+    waits for its result.
+    '''
+
+    def __init__(self, fs, pool, demand_pool, page_size, speculate):
+        self.fs = fs
+        self.pool = pool
+        self.demand_pool = demand_pool
+        self.page_size = page_size
+        self.speculate = speculate
+        self.lock = threading.Lock()
+
+        # Map of call key to _Call
+        self.calls = {}
+
+    def submit(self, key, f, *args, **kwargs):
+        '''
+        Start the call f(*args) for the given key unless it has been already,
+        returning its AsyncResult. If 'demand' is set, the result is needed
+        now: unless the call has already started, it is made on demand_pool.
+        '''
+
+        demand = kwargs.get('demand', False)
+
+        self.lock.acquire()
+        try:
+            c = self.calls.get(key, None)
+            if c is None:
+                c = self.calls[key] = _Call()
+            elif c.started or not demand:
+                return c.result
+
+            pool = self.demand_pool if demand else self.pool
+            c.result = pool.apply_async(self._run, (c, f, args))
+            return c.result
+        finally:
+            self.lock.release()
+
+    def _run(self, c, f, args):
+        self.lock.acquire()
+        try:
+            won = not c.started
+            c.started = True
+        finally:
+            self.lock.release()
+
+        # Lost the race with the other run of this call; share its result
+        if not won:
+            c.done.wait()
+            if c.exc_info:
+                raise c.exc_info[0], c.exc_info[1], c.exc_info[2]
+            return c.value
+
+        try:
+            c.value = f(*args)
+            return c.value
+        except:
+            c.exc_info = sys.exc_info()
+            raise
+        finally:
+            c.done.set()
+
+    def prefetch_search(self, i, page_no, demand=False):
+        return self.submit(
+            ('search', i, page_no), self._search, i, page_no, demand=demand)
+
+    def prefetch_food(self, food_id, demand=False):
+        return self.submit(
+            ('food', food_id), self._food_get, food_id, demand=demand)
+
+    def search(self, i, page_no):
+        '''
+        Return the given page of search results for ingredient 'i', and start
+        fetching the page after it.
+        '''
+
+        foods = self.prefetch_search(i, page_no, demand=True).get()
+        if int(foods.get('total_results', 0)) > (page_no + 1) * self.page_size:
+            self.prefetch_search(i, page_no + 1)
+
+        return foods
+
+    def food_get(self, food_id):
+        return self.prefetch_food(food_id, demand=True).get()
+
+    def _search(self, i, page_no):
+        foods = self.fs.foods_search(
+            search_expression=i, page_number=page_no,
+            max_results=self.page_size)['foods']
+
+        if 'food' in foods:
+            if type(foods['food']) != list:
+                foods['food'] = [foods['food']]
+
+            for food in foods['food'][:self.speculate]:
+                self.prefetch_food(food['food_id'])
+
+        return foods
+
+    def _food_get(self, food_id):
+        return self.fs.food_get(food_id=food_id)
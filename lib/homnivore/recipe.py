@@ -36,7 +36,10 @@
 
 
 from fatsecret import FatSecret
+import instrument
 import logging
+from mapping import normalize_name
+import os
 import pprint
 import re
 import unittest
@@ -193,6 +196,7 @@ def parse_quantity(s):
         '"%s" at offset %d ' % (s, nr[1]))
 
 
+@instrument.timed('recipe.parse_ingredient')
 def parse_ingredient(s):
     '''
     Parse an ingredient specification into an ((type, value), ingredient)
@@ -216,6 +220,7 @@ def parse_ingredient(s):
     return (q, s[r[1]:].strip())
 
 
+@instrument.timed('recipe.get_food_nutrition')
 def get_food_nutrition(unit, value, food_id, fs):
     '''
     Return a dictionary of nutrition information for the given quantity a of
@@ -223,6 +228,15 @@ def get_food_nutrition(unit, value, food_id, fs):
     None is returned.
     '''
 
+    return get_serving_nutrition(unit, value, fs.food_get(food_id=food_id))
+
+
+def get_serving_nutrition(unit, value, food):
+    '''
+    Like get_food_nutrition(), but takes the food description as returned by
+    the FatSecret food.get API rather than fetching it.
+    '''
+
     def gen_wrap_f(x):
         if type(x) == list:
             for xx in x:
@@ -301,7 +315,6 @@ def get_food_nutrition(unit, value, food_id, fs):
                 lambda x: (x[0], float(x[1]) * scale_val),
                 filter(filter_ingredient, serv.iteritems())))
 
-    food = fs.food_get(food_id=food_id)
     servings = food['food']['servings']['serving']
     if type(servings) == list:
         for s in servings:
@@ -314,6 +327,183 @@ def get_food_nutrition(unit, value, food_id, fs):
         return scale_serving(servings)
 
 
+def get_ingredient_nutrition(s, fs, mapping=None):
+    '''
+    Return a dictionary of nutrition information for the given ingredient
+    specification, using the first search result for the ingredient. If no
+    food could be found or no suitable conversion could be found, None is
+    returned.
+
+    If a FoodMapping is given, ingredients that it knows exactly are not
+    searched for, and the foods found for those that it doesn't are added to
+    it.
+    '''
+
+    q, i = parse_ingredient(s)
+    unit, value = q
+
+    food_id = mapping.get(i) if mapping else None
+    if food_id:
+        return get_food_nutrition(unit, value, food_id, fs)
+
+    foods = fs.foods_search(search_expression=i)['foods']
+    if 'food' not in foods:
+        return None
+
+    foods = foods['food']
+    if type(foods) != list:
+        foods = [foods]
+
+    if mapping:
+        mapping.put(i, foods[0]['food_id'])
+
+    return get_food_nutrition(unit, value, foods[0]['food_id'], fs)
+
+
+def sum_nutrition(ns):
+    '''
+    Sum an iterable of nutrition dictionaries.
+    '''
+
+    total = {}
+    for n in ns:
+        for k, v in n.iteritems():
+            total[k] = total.get(k, 0.0) + v
+
+    return total
+
+
+class RecipeNutrition(object):
+    '''
+    Computes nutrition for a recipe incrementally, as its lines are edited.
+
+    Everything that goes into a line's nutrition is memoized: the parse of each
+    line, the food found for each (normalized) ingredient name, the food
+    descriptions themselves and the nutrition for each (unit, value, food_id).
+    Recomputing a recipe after editing a line therefore only looks up what's
+    new about that line (and changing just its quantity looks up nothing),
+    while changing the number of servings looks up nothing at all.
+    '''
+
+    def __init__(self, fs, mapping=None):
+        self.fs = fs
+        self.mapping = mapping
+
+        # Map of line to parse_ingredient() result
+        self.parsed = {}
+
+        # Map of normalized ingredient name to food_id (or None if nothing was
+        # found)
+        self.food_ids = {}
+
+        # Map of line to food_id, for foods chosen explicitly
+        self.choices = {}
+
+        # Map of food_id to food.get response
+        self.foods = {}
+
+        # Map of (unit, value, food_id) to nutrition
+        self.nutrition = {}
+
+        # The last recipe computed, as a (resolved lines, total nutrition)
+        # tuple, where the resolved lines are (line, food_id) tuples
+        self.last = None
+
+    def choose(self, l, food_id):
+        '''
+        Use the given food for the given line rather than the first search
+        result.
+        '''
+
+        self.choices[l.strip()] = food_id
+
+    def parse(self, l):
+        if l not in self.parsed:
+            self.parsed[l] = parse_ingredient(l)
+
+        return self.parsed[l]
+
+    def food_id(self, l):
+        '''
+        Return the food_id to use for the given line, or None if no food could
+        be found.
+        '''
+
+        if l in self.choices:
+            return self.choices[l]
+
+        _, i = self.parse(l)
+        name = normalize_name(i)
+        if name in self.food_ids:
+            return self.food_ids[name]
+
+        food_id = self.mapping.get(i) if self.mapping else None
+        if food_id is None:
+            foods = self.fs.foods_search(search_expression=i)['foods']
+            if 'food' not in foods:
+                food_id = None
+            else:
+                foods = foods['food']
+                if type(foods) != list:
+                    foods = [foods]
+
+                food_id = foods[0]['food_id']
+                if self.mapping:
+                    self.mapping.put(i, food_id)
+
+        self.food_ids[name] = food_id
+        return food_id
+
+    def line_nutrition(self, l):
+        '''
+        Return a (food_id, nutrition) tuple for the given line. Either may be
+        None if no food or no conversion could be found.
+        '''
+
+        l = l.strip()
+        q, _ = self.parse(l)
+        unit, value = q
+
+        food_id = self.food_id(l)
+        if food_id is None:
+            return (None, None)
+
+        key = (unit, value, food_id)
+        if key not in self.nutrition:
+            if food_id not in self.foods:
+                self.foods[food_id] = self.fs.food_get(food_id=food_id)
+
+            self.nutrition[key] = get_serving_nutrition(
+                unit, value, self.foods[food_id])
+
+        return (food_id, self.nutrition[key])
+
+    def compute(self, lines, servings=1):
+        '''
+        Compute nutrition for a recipe, returning a dictionary with 'lines' (a
+        list of (line, food_id, nutrition) tuples), 'total' and
+        'per_serving' nutrition. Lines without nutrition don't count towards
+        the totals.
+        '''
+
+        lines = tuple(l.strip() for l in lines if l.strip())
+        results = [(l,) + self.line_nutrition(l) for l in lines]
+
+        # Key on each line's food as well, which choose() may have changed
+        resolved = tuple((l, food_id) for l, food_id, _ in results)
+        if self.last and self.last[0] == resolved:
+            total = self.last[1]
+        else:
+            total = sum_nutrition(n for _, _, n in results if n is not None)
+            self.last = (resolved, total)
+
+        return {
+            'lines': results,
+            'total': total,
+            'per_serving': dict(
+                (k, v / servings) for k, v in total.iteritems())}
+
+
 class _NumericQuantityTestCase(unittest.TestCase):
 
     def test_simple(self):
@@ -373,15 +563,26 @@ class _IngredientTestCase(unittest.TestCase):
         self.assertEquals('garlic', i)
 
 
-class _NutritionTestCase(unittest.TestCase):
-    
-    def setUp(self):
-        import os
+def _test_fatsecret():
+    from replay import ReplayTransport
 
-        self.fs = FatSecret(
+    # Hit the real API if we have credentials; otherwise use recorded
+    # responses
+    if 'FS_CONSUMER_KEY' in os.environ:
+        return FatSecret(
             consumerKey=os.environ['FS_CONSUMER_KEY'],
             secretKey=os.environ['FS_SECRET_KEY'])
 
+    return FatSecret(transport=ReplayTransport(
+        os.path.join(
+            os.path.dirname(__file__), 'test', 'fixtures', 'fatsecret.json')))
+
+
+class _NutritionTestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.fs = _test_fatsecret()
+
     def test_single(self):
         ni = get_ingredient_nutrition('1 clove garlic', self.fs)
         self.assertEquals(ni['calories'], 4)
@@ -392,6 +593,101 @@ class _NutritionTestCase(unittest.TestCase):
         self.assertEquals(ni['calories'], 8)
         self.assertEquals(ni['protein'], 0.38)
 
+    def test_mapping(self):
+        from mapping import FoodMapping
+
+        mapping = FoodMapping()
+        get_ingredient_nutrition('1 clove garlic', self.fs, mapping)
+        self.assertEquals(mapping.get('garlic'), '36397')
+
+        # Known ingredients are not searched for
+        self.fs.foods_search = None
+        ni = get_ingredient_nutrition('2 cloves garlic', self.fs, mapping)
+        self.assertEquals(ni['calories'], 8)
+
+    def test_mapping_fuzzy(self):
+        from mapping import FoodMapping
+
+        # Similar names are not assumed to be the same food
+        mapping = FoodMapping()
+        mapping.put('olive oyl', 'bogus')
+        ni = get_ingredient_nutrition('2 tbsp olive oil', self.fs, mapping)
+        self.assertEquals(ni['calories'], 238)
+        self.assertEquals(mapping.get('olive oil'), '33885')
+        self.assertEquals(mapping.get('olive oyl'), 'bogus')
+
+
+class _CountingFatSecret(object):
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.calls = 0
+
+    def foods_search(self, **kwargs):
+        self.calls += 1
+        return self.fs.foods_search(**kwargs)
+
+    def food_get(self, **kwargs):
+        self.calls += 1
+        return self.fs.food_get(**kwargs)
+
+
+class _RecipeNutritionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fs = _CountingFatSecret(_test_fatsecret())
+        self.rn = RecipeNutrition(self.fs)
+
+    def test_compute(self):
+        r = self.rn.compute([u'1 clove garlic', u'2 tbsp olive oil'], 2)
+        self.assertEquals(r['total']['calories'], 242)
+        self.assertEquals(r['per_serving']['calories'], 121)
+        self.assertEquals(r['lines'][0][:2], (u'1 clove garlic', '36397'))
+        self.assertEquals(self.fs.calls, 4)
+
+    def test_incremental(self):
+        lines = [u'1 clove garlic', u'2 tbsp olive oil', u'1 medium onion']
+        self.rn.compute(lines)
+        self.assertEquals(self.fs.calls, 6)
+
+        # Servings
+        r = self.rn.compute(lines, 4)
+        self.assertEquals(self.fs.calls, 6)
+
+        # Quantity
+        lines[0] = u'2 cloves garlic'
+        r = self.rn.compute(lines, 4)
+        self.assertEquals(self.fs.calls, 6)
+        self.assertEquals(r['lines'][0][2]['calories'], 8)
+
+        # Ingredient
+        lines[2] = u'1 cup sugar'
+        r = self.rn.compute(lines, 4)
+        self.assertEquals(self.fs.calls, 8)
+        self.assertEquals(
+            r['total'],
+            sum_nutrition(
+                get_ingredient_nutrition(l, self.fs.fs) for l in lines))
+
+    def test_choose(self):
+        self.rn.choose(u'1 clove garlic', '33885')
+        r = self.rn.compute([u'1 clove garlic'])
+        self.assertEquals(r['lines'][0][1], '33885')
+        self.assertEquals(self.fs.calls, 1)
+
+    def test_choose_after_compute(self):
+        lines = [u'1 clove garlic', u'2 tbsp olive oil']
+        r = self.rn.compute(lines)
+        self.assertEquals(r['total']['calories'], 242)
+
+        self.rn.choose(u'2 tbsp olive oil', '33814')
+        r = self.rn.compute(lines)
+        self.assertEquals(r['lines'][1][1], '33814')
+        self.assertEquals(
+            r['total'],
+            sum_nutrition(n for _, _, n in r['lines']))
+        self.assertEquals(r['total']['calories'], 208)
+
 
 if __name__ == '__main__':
     import codecs
@@ -399,11 +695,18 @@ if __name__ == '__main__':
     from optparse import OptionParser
     import sys
 
+    from fatsecret import OAuthTransport
+    from journal import Journal
+    from mapping import FoodMapping
+    from nutrition import LocalBackend, TieredBackend
+    from replay import FixtureStore, RecordingTransport, ReplayTransport
+
     op = OptionParser(
         usage='%prog [options] <consumer key> <secret key>',
         description='''Reads recipe ingredients from stdin, one at a time, and
 writes total nutrition information for the recipe to stdout. The keys
-specified are to be used for the FatSecret API.''')
+specified are to be used for the FatSecret API; they are not required when
+replaying recorded responses or using a local database.''')
     op.add_option('-i', dest='infile', default='-',
         help='read from the specified file (default: %default)')
     op.add_option('-o', dest='outfile', default='-',
@@ -412,6 +715,25 @@ specified are to be used for the FatSecret API.''')
         help='increase verbosity; can be used multiple times')
     op.add_option('-s', dest='servings', type='int', default=1,
         help='divide nutrition into the servings (default: %default)')
+    op.add_option('-t', dest='timings', action='store_true', default=False,
+        help='write a summary of time spent in each stage to stderr')
+    op.add_option('--journal', dest='journal', default=None,
+        help='record each resolved ingredient in the specified journal ' + \
+            'file, and skip ingredients already recorded there')
+    op.add_option('--mapping', dest='mapping', default=None,
+        help='look up ingredients in the specified food mapping file ' + \
+            'before searching for them, and add the foods chosen to it')
+    op.add_option('--cache', dest='cache', default=None,
+        help='cache FatSecret API responses in the specified local ' + \
+            'database, and look them up there first')
+    op.add_option('--local', dest='local', default=None,
+        help='look up foods in the specified local database (see ' + \
+            'nutrition.py) rather than with the FatSecret API')
+    op.add_option('--record', dest='record', default=None,
+        help='record FatSecret API responses to the specified fixture file')
+    op.add_option('--replay', dest='replay', default=None,
+        help='replay FatSecret API responses from the specified fixture ' + \
+            'file rather than using the network')
     
     opts, args = op.parse_args()
 
@@ -420,13 +742,22 @@ specified are to be used for the FatSecret API.''')
         format='%(message)s',
         level=logging.CRITICAL - opts.verbosity * 10)
 
-    if len(args) < 1:
-        op.error('missing consumer key')
-    consumerKey = args[0]
+    if opts.local:
+        transport = None
+    elif opts.replay:
+        transport = ReplayTransport(opts.replay)
+    else:
+        if len(args) < 1:
+            op.error('missing consumer key')
+        consumerKey = args[0]
+
+        if len(args) < 2:
+            op.error('missing secret key')
+        secretKey = args[1]
 
-    if len(args) < 2:
-        op.error('missing secret key')
-    secretKey = args[1]
+        transport = OAuthTransport(consumerKey, secretKey)
+        if opts.record:
+            transport = RecordingTransport(transport, FixtureStore(opts.record))
 
     ifile = sys.stdin if opts.infile == '-' \
         else open(opts.infile, 'r')
@@ -435,31 +766,67 @@ specified are to be used for the FatSecret API.''')
         else open(opts.outfile, 'w')
     ostream = codecs.getwriter('utf-8')(ofile)
 
-    fs = FatSecret(consumerKey, secretKey)
+    sink = instrument.MemorySink()
+    if opts.timings:
+        instrument.configure(sink)
+
+    if opts.local:
+        fs = LocalBackend(opts.local)
+    else:
+        fs = FatSecret(transport=transport)
+        if opts.cache:
+            fs = TieredBackend(fs, LocalBackend(opts.cache))
+
+    journal = Journal(opts.journal) if opts.journal else None
+    mapping = FoodMapping(opts.mapping) if opts.mapping else None
 
     nutrition = None
     for l in istream.readlines():
-        q, i = parse_ingredient(l)
-        unit, value = q
+        l = l.strip()
+        if not l:
+            continue
 
-        foods = fs.foods_search(search_expression=i)['foods']
-        if foods['total_results'] == 0:
-            print >> sys.stderr, 'No matches for ' + i
-            sys.exit(1)
-
-        foods = foods['food']
-        if opts.infile == '-' or opts.outfile == '-':
-            food_id = foods[0]['food_id']
+        # Skip anything that we've already resolved
+        if journal and journal.get(l):
+            n = journal.get(l)['nutrition']
         else:
-            print l.strip()
-
-            for i in range(len(foods)):
-                print '[%d] %s' % (i, foods[i]['food_name'])
-            sys.stdout.write('>> ')
-            choice = int(sys.stdin.readline().strip())
-            food_id = foods[choice]['food_id']
+            q, i = parse_ingredient(l)
+            unit, value = q
+
+            food_id = mapping.get(i) if mapping else None
+            if food_id is None:
+                # Similar ingredients may well be different foods, so only
+                # mention them
+                m = mapping.match(i) if mapping else None
+                if m:
+                    logging.warning(
+                        '%s: searching, but "%s" (food %s) is similar' % \
+                            (i, m[1], m[0]))
+
+                foods = fs.foods_search(search_expression=i)['foods']
+                if foods['total_results'] == 0:
+                    print >> sys.stderr, 'No matches for ' + i
+                    sys.exit(1)
+
+                foods = foods['food']
+                if opts.infile == '-' or opts.outfile == '-':
+                    food_id = foods[0]['food_id']
+                else:
+                    print l
+
+                    for fn in range(len(foods)):
+                        print '[%d] %s' % (fn, foods[fn]['food_name'])
+                    sys.stdout.write('>> ')
+                    choice = int(sys.stdin.readline().strip())
+                    food_id = foods[choice]['food_id']
+
+                if mapping:
+                    mapping.put(i, food_id)
+
+            n = get_food_nutrition(unit, value, food_id, fs)
+            if journal:
+                journal.record(l, food_id, n)
 
-        n = get_food_nutrition(unit, value, food_id, fs)
         logging.info(pprint.pformat(n))
 
         if nutrition == None:
@@ -469,7 +836,17 @@ specified are to be used for the FatSecret API.''')
                 (k, n.get(k, 0.0) + nutrition.get(k, 0.0)) \
                     for k in set(n.keys() + nutrition.keys()))
 
+    if mapping:
+        mapping.save()
+
     # Scale by servings
     nutrition = dict(
         (k, v / opts.servings) for k, v in nutrition.iteritems())
     print >> ostream, json.dumps(nutrition)
+
+    if opts.timings:
+        print >> sys.stderr, sink.summary()
+
+        if isinstance(fs, TieredBackend):
+            for t in TieredBackend.TIERS:
+                print >> sys.stderr, '%s: %s' % (t, fs.stats()[t])
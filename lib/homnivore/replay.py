@@ -0,0 +1,281 @@
+'''
+Record and replay of FatSecret API traffic.
+
+Fixture files are JSON lists of {"params": {...}, "response": {...}} objects,
+where "params" are the API request parameters (without OAuth or format
+parameters) and "response" is the decoded JSON response body. They can be
+written by RecordingTransport and served back either in-process by
+ReplayTransport or over HTTP by StandInServer, optionally with injected
+latency to simulate a remote API.
+'''
+
+import BaseHTTPServer
+from fatsecret import normalize_kwargs
+import json
+import logging
+import random
+import SocketServer
+import threading
+import time
+import urlparse
+
+# Parameters that don't affect the response content
+_IGNORED_PARAMS = ('format',)
+
+# Parameters that FatSecret defaults if they are not specified; filled in so
+# that calls with and without them map to the same fixture
+_DEFAULT_PARAMS = {
+    'foods.search': {
+        'page_number': '0',
+        'max_results': '20'}}
+
+
+def fixture_key(params):
+    '''
+    Compute the fixture key for the given request parameters.
+    '''
+
+    p = dict(_DEFAULT_PARAMS.get(params.get('method'), {}))
+    p.update(
+        (k, v) for k, v in params.iteritems() \
+            if k not in _IGNORED_PARAMS and not k.startswith('oauth_'))
+
+    return normalize_kwargs(p)
+
+
+def inject_latency(latency, jitter):
+    '''
+    Sleep for 'latency' seconds plus a uniformly distributed random amount of
+    up to 'jitter' seconds.
+    '''
+
+    delay = latency + random.uniform(0, jitter)
+    if delay > 0:
+        time.sleep(delay)
+
+
+class ReplayMissError(Exception):
+
+    def __init__(self, params):
+        Exception.__init__(self, 'No recorded response for %r' % (params,))
+        self.params = params
+
+
+class FixtureStore(object):
+    '''
+    A set of recorded responses, optionally backed by a fixture file.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+
+        # Map of fixture key to (params, response body string)
+        self.entries = {}
+
+        if path:
+            try:
+                f = open(path, 'r')
+            except IOError:
+                pass
+            else:
+                try:
+                    for e in json.load(f):
+                        self.entries[fixture_key(e['params'])] = \
+                            (e['params'], json.dumps(e['response']))
+                finally:
+                    f.close()
+
+    def get(self, params):
+        '''
+        Return the recorded response body for the given parameters, or None
+        if there isn't one.
+        '''
+
+        e = self.entries.get(fixture_key(params), None)
+        if e is None:
+            return None
+
+        return e[1]
+
+    def put(self, params, body):
+        params = dict(
+            (k, v) for k, v in params.iteritems() \
+                if k not in _IGNORED_PARAMS and not k.startswith('oauth_'))
+
+        self.lock.acquire()
+        try:
+            self.entries[fixture_key(params)] = (params, body)
+        finally:
+            self.lock.release()
+
+    def save(self):
+        self.lock.acquire()
+        try:
+            entries = sorted(self.entries.iteritems())
+        finally:
+            self.lock.release()
+
+        f = open(self.path, 'w')
+        try:
+            json.dump(
+                [{'params': p, 'response': json.loads(b)} \
+                    for _, (p, b) in entries],
+                f, indent=4, sort_keys=True)
+        finally:
+            f.close()
+
+
+class RecordingTransport(object):
+    '''
+    Transport that passes calls through to another transport, recording each
+    response in a FixtureStore.
+    '''
+
+    def __init__(self, transport, store, autosave=True):
+        self.transport = transport
+        self.store = store
+        self.autosave = autosave
+
+    def request(self, params):
+        body = self.transport.request(params)
+
+        # Don't record errors; these are usually transient or due to bad
+        # credentials
+        if 'error' not in json.loads(body):
+            self.store.put(params, body)
+            if self.autosave and self.store.path:
+                self.store.save()
+
+        return body
+
+
+class ReplayTransport(object):
+    '''
+    Transport that serves responses from a FixtureStore rather than the
+    network. Raises ReplayMissError for calls that were never recorded.
+    '''
+
+    def __init__(self, store, latency=0.0, jitter=0.0):
+        if isinstance(store, basestring):
+            store = FixtureStore(store)
+
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+
+    def request(self, params):
+        inject_latency(self.latency, self.jitter)
+
+        body = self.store.get(params)
+        if body is None:
+            raise ReplayMissError(params)
+
+        return body
+
+
+class _StandInRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.respond(urlparse.urlsplit(self.path).query)
+
+    def do_POST(self):
+        length = int(self.headers.get('content-length', 0))
+        self.respond(self.rfile.read(length))
+
+    def respond(self, qs):
+        params = dict(urlparse.parse_qsl(qs, keep_blank_values=True))
+
+        inject_latency(self.server.latency, self.server.jitter)
+
+        body = self.server.store.get(params)
+        if body is None:
+            body = json.dumps({
+                'error': {
+                    'code': 1,
+                    'message': 'No recorded response for %r' % \
+                        (dict(fixture_key(params)),)}})
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logging.debug(fmt, *args)
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    A local HTTP server that impersonates the FatSecret REST endpoint,
+    serving responses from a FixtureStore. OAuth signatures are not checked.
+
+    Point a FatSecret object at it with
+
+        FatSecret(transport=OAuthTransport(key, secret, server.endpoint))
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, store, host='localhost', port=0, latency=0.0,
+            jitter=0.0):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, (host, port), _StandInRequestHandler)
+
+        if isinstance(store, basestring):
+            store = FixtureStore(store)
+
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+
+    @property
+    def endpoint(self):
+        return 'http://%s:%d/rest/server.api' % self.server_address[:2]
+
+    def start(self):
+        '''
+        Serve requests from a background thread.
+        '''
+
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+
+        return self
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    import sys
+
+    op = OptionParser(
+        usage='%prog [options] <fixture>',
+        description='''Serve recorded FatSecret API responses from the given
+fixture file over HTTP, impersonating the FatSecret REST endpoint.''')
+    op.add_option('-p', dest='port', type='int', default=8080,
+        help='port to listen on (default: %default)')
+    op.add_option('-l', dest='latency', type='float', default=0.0,
+        help='seconds of latency to inject per call (default: %default)')
+    op.add_option('-j', dest='jitter', type='float', default=0.0,
+        help='maximum seconds of random latency to add (default: %default)')
+    op.add_option('-v', dest='verbosity', action='count', default=0,
+        help='increase verbosity; can be used multiple times')
+
+    opts, args = op.parse_args()
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        format='%(message)s',
+        level=logging.CRITICAL - opts.verbosity * 10)
+
+    if len(args) < 1:
+        op.error('no fixture file specified')
+
+    server = StandInServer(
+        args[0], port=opts.port, latency=opts.latency, jitter=opts.jitter)
+    print >> sys.stderr, 'Serving %d responses at %s' % \
+        (len(server.store.entries), server.endpoint)
+    server.serve_forever()
@@ -2,12 +2,53 @@
 Scaping utilities.
 '''
 
-from lxml import etree
+from . import instrument
 from .models import Recipe
 import re
+import StringIO
 import urllib2
 from urlparse import urlsplit
 
+# XPath expressions used by the scrapers, by name. lxml is only imported, and
+# these compiled, when first needed (see _xpath()), so that importing this
+# module (e.g. just to call can_scrape()) is cheap.
+__XPATHS = {
+    'myrecipes.title': '//head/title',
+    'myrecipes.ingredients': '//li[@itemprop="ingredient"]',
+    'myrecipes.amount': 'span[@itemprop="amount"]',
+    'myrecipes.name': 'span[@itemprop="name"]',
+    'myrecipes.preparation': 'span[@itemprop="preparation"]',
+    'myrecipes.steps': '//ol[@itemprop="instructions"]/li',
+    'myrecipes.image': '//img[@alt=$alt]'}
+
+# Map of names to compiled XPath expressions
+__COMPILED_XPATHS = {}
+
+__WHITESPACE_RE = re.compile(r'\s+')
+__STEP_NUMBER_RE = re.compile(r'^\d+\.\s+', re.UNICODE)
+
+
+def _xpath(name):
+    '''
+    Return the compiled XPath expression with the given name.
+    '''
+
+    xpath = __COMPILED_XPATHS.get(name)
+    if xpath is None:
+        from lxml import etree
+        xpath = __COMPILED_XPATHS[name] = etree.XPath(__XPATHS[name])
+
+    return xpath
+
+
+def warm():
+    '''
+    Import lxml and compile all XPath expressions ahead of the first scrape.
+    '''
+
+    for name in __XPATHS:
+        _xpath(name)
+
 
 ###############################################################################
 # Scraper functions; one per domain
@@ -17,26 +58,26 @@ from urlparse import urlsplit
 # be passed to the Recipe constructor.
 ###############################################################################
 def __www_myrecipes_com_scraper(tree, **kwargs):
-    name = tree.xpath('//head/title')[0].text
+    name = _xpath('myrecipes.title')(tree)[0].text
     name = name[:len(name) - len(' Recipe | MyRecipes.com')]
 
     ingredients = []
-    for e in tree.xpath('//li[@itemprop="ingredient"]'):
+    for e in _xpath('myrecipes.ingredients')(tree):
         ingredient = \
-            e.xpath('span[@itemprop="amount"]')[0].text + ' ' + \
-            e.xpath('span[@itemprop="name"]')[0].text + ' ' + \
-            e.xpath('span[@itemprop="preparation"]')[0].text
+            _xpath('myrecipes.amount')(e)[0].text + ' ' + \
+            _xpath('myrecipes.name')(e)[0].text + ' ' + \
+            _xpath('myrecipes.preparation')(e)[0].text
         ingredient = ingredient.strip()
-        ingredient = re.sub(r'\s+', ' ', ingredient)
+        ingredient = __WHITESPACE_RE.sub(' ', ingredient)
 
         ingredients += [ingredient]
 
     steps = []
-    for e in tree.xpath('//ol[@itemprop="instructions"]/li'):
-        steps += [re.sub(r'^\d+\.\s+', '', e.text, flags=re.UNICODE)]
+    for e in _xpath('myrecipes.steps')(tree):
+        steps += [__STEP_NUMBER_RE.sub('', e.text)]
 
     image = None
-    for e in tree.xpath('//img[@alt="%s Recipe"]' % name):
+    for e in _xpath('myrecipes.image')(tree, alt=name + ' Recipe'):
         image = e.attrib['src']
 
     return Recipe(
@@ -49,6 +90,30 @@ __SCRAPER_MAP = {
     'www.myrecipes.com': __www_myrecipes_com_scraper}
 
 
+def _extract(url, tree, user_id):
+    '''
+    Construct a Recipe object from the parsed page at the given URL using the
+    scraper for its host.
+    '''
+
+    kwargs = {
+        'url': url,
+        'user_id': user_id}
+
+    hostname = urlsplit(url).hostname
+    with instrument.timer('scrape.extract.' + hostname):
+        return __SCRAPER_MAP[hostname](tree, **kwargs)
+
+
+def can_scrape(url):
+    '''
+    Whether or not we have a scraper for the given URL.
+    '''
+
+    return urlsplit(url).hostname in __SCRAPER_MAP
+
+
+@instrument.timed('scrape')
 def scrape(url, user_id):
     '''
     Scrape a Recipe from the given URL on behalf of the given user.
@@ -57,20 +122,38 @@ def scrape(url, user_id):
     be found for the specified URL).
     '''
 
-    url_components = urlsplit(url)
+    if not can_scrape(url):
+        return None
+
+    # Fetch the URL and construct an LXML tree. The body is read as it is
+    # parsed, so the parse timer includes download time.
+    with instrument.timer('scrape.urlopen'):
+        result = urllib2.urlopen(url)
 
-    scraper = __SCRAPER_MAP.get(url_components.hostname, None)
-    if not scraper:
+    from lxml import etree
+    with instrument.timer('scrape.parse'):
+        parser = etree.HTMLParser()
+        tree = etree.parse(result, parser)
+
+    return _extract(url, tree, user_id)
+
+
+@instrument.timed('scrape_html')
+def scrape_html(url, html, user_id):
+    '''
+    Like scrape(), but extracts the Recipe from the given HTML (e.g. the DOM
+    of the page as sent by the user's browser) rather than fetching the URL.
+    '''
+
+    if not can_scrape(url):
         return None
 
-    # Fetch the URL and construct an LXML tree
-    result = urllib2.urlopen(url)
-    parser = etree.HTMLParser()
-    tree = etree.parse(result, parser)
+    if isinstance(html, unicode):
+        html = html.encode('utf-8')
 
-    # Construct a Recipe object and fill it out using the scraper
-    kwargs = {
-        'url': url,
-        'user_id': user_id}
+    from lxml import etree
+    with instrument.timer('scrape.parse'):
+        parser = etree.HTMLParser(encoding='utf-8')
+        tree = etree.parse(StringIO.StringIO(html), parser)
 
-    return scraper(tree, **kwargs)
+    return _extract(url, tree, user_id)
@@ -0,0 +1,110 @@
+'''
+Background task queues.
+
+Work that would take too long to do while a request waits (e.g. calling the
+FatSecret API for every ingredient of a recipe) is deferred to a queue: calling
+defer(f, *args, **kwargs) arranges for f(*args, **kwargs) to be called later.
+Functions must be defined at module level so that they can be pickled.
+
+On App Engine this uses the deferred library (which must be enabled in
+app.yaml). For tests and command-line use, LocalQueue runs tasks in-process.
+'''
+
+import logging
+import threading
+
+# The installed queue; None to use an AppEngineQueue
+_queue = None
+
+
+def configure(queue):
+    '''
+    Install the given queue, or revert to the App Engine queue if it is None.
+    '''
+
+    global _queue
+    _queue = queue
+
+
+def get_queue():
+    if _queue is None:
+        return AppEngineQueue()
+
+    return _queue
+
+
+def defer(f, *args, **kwargs):
+    '''
+    Call f(*args, **kwargs) in the background on the installed queue.
+    '''
+
+    get_queue().defer(f, *args, **kwargs)
+
+
+class AppEngineQueue(object):
+    '''
+    Runs tasks on an App Engine task queue. Tasks that raise an exception are
+    retried.
+    '''
+
+    def __init__(self, queue_name='default'):
+        self.queue_name = queue_name
+
+    def defer(self, f, *args, **kwargs):
+        from google.appengine.ext import deferred
+
+        deferred.defer(f, _queue=self.queue_name, *args, **kwargs)
+
+
+class LocalQueue(object):
+    '''
+    Stand-in for AppEngineQueue that holds tasks in memory until run() is
+    called, or runs each in a new thread if 'threaded' is set. Tasks are not
+    retried.
+    '''
+
+    def __init__(self, threaded=False):
+        self.threaded = threaded
+        self.lock = threading.Lock()
+
+        # List of pending (f, args, kwargs) tuples
+        self.tasks = []
+
+    def defer(self, f, *args, **kwargs):
+        if self.threaded:
+            t = threading.Thread(target=self._run_task, args=(f, args, kwargs))
+            t.daemon = True
+            t.start()
+            return
+
+        self.lock.acquire()
+        try:
+            self.tasks += [(f, args, kwargs)]
+        finally:
+            self.lock.release()
+
+    def _run_task(self, f, args, kwargs):
+        try:
+            f(*args, **kwargs)
+        except Exception:
+            logging.exception('task %s failed' % f.__name__)
+
+    def run(self):
+        '''
+        Run pending tasks, including any that they defer, until there are none
+        left, returning the number run. Exceptions raised by tasks are
+        propagated, leaving the remaining tasks pending.
+        '''
+
+        n = 0
+        while True:
+            self.lock.acquire()
+            try:
+                if not self.tasks:
+                    return n
+                f, args, kwargs = self.tasks.pop(0)
+            finally:
+                self.lock.release()
+
+            f(*args, **kwargs)
+            n += 1
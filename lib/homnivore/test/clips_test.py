@@ -0,0 +1,20 @@
+from ..clips import put_clip, take_clip
+from ..models import Recipe
+import unittest
+
+class ClipsTestCase(unittest.TestCase):
+
+    def test_round_trip(self):
+        expected = Recipe(
+            user_id='user', url='http://example.com/', name='Recipe',
+            ingredients=[u'1 clove garlic'], steps=[u'Eat it'])
+
+        token = put_clip(expected)
+        actual = take_clip(token)
+        self.assertEqual(expected.to_xml(), actual.to_xml())
+
+        # Tokens can only be used once
+        self.assertEqual(None, take_clip(token))
+
+    def test_unknown(self):
+        self.assertEqual(None, take_clip('nonesuch'))
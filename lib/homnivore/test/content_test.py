@@ -0,0 +1,80 @@
+from ..content import canonical_url, content_hash, get_fresh_content, \
+    prefetch_content, record_scrape, share_content
+from ..models import Recipe
+import unittest
+
+class CanonicalUrlTestCase(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(
+            'http://www.myrecipes.com/recipe/toast/',
+            canonical_url('HTTP://WWW.MyRecipes.com:80/recipe/toast/#reviews'))
+
+    def test_query(self):
+        self.assertEqual(
+            'http://example.com/recipe?a=1&b=2',
+            canonical_url('http://example.com/recipe?b=2&utm_source=x&a=1'))
+
+    def test_path(self):
+        self.assertEqual(
+            'https://example.com:8443/',
+            canonical_url('https://example.com:8443'))
+
+
+class ContentTestCase(unittest.TestCase):
+
+    def make_recipe(self, user_id, url='http://example.com/toast'):
+        return Recipe(
+            user_id=user_id, url=url, name='Toast',
+            ingredients=[u'1 slice bread'], steps=[u'Toast it'])
+
+    def test_hash(self):
+        self.assertEqual(
+            content_hash(self.make_recipe('alice')),
+            content_hash(self.make_recipe('bob', 'http://example.com/other')))
+
+        r = self.make_recipe('alice')
+        r.steps = [u'Burn it']
+        self.assertNotEqual(content_hash(self.make_recipe('alice')),
+            content_hash(r))
+
+    def test_share(self):
+        record_scrape(self.make_recipe('scraper'))
+
+        a = share_content(self.make_recipe('alice'))
+        a.put()
+        b = share_content(self.make_recipe('bob'))
+        b.put()
+
+        self.assertEqual(a.content.key(), b.content.key())
+        self.assertEqual([], Recipe.get(b.key()).ingredients)
+        self.assertEqual(
+            [u'1 slice bread'], Recipe.get(b.key()).get_ingredients())
+
+    def test_private(self):
+        # Content that the server hasn't scraped itself is never shared
+        r = self.make_recipe('alice')
+        r.steps = [u'Toast it twice']
+        r = share_content(r)
+        r.put()
+
+        r = Recipe.get(r.key())
+        self.assertEqual(None, Recipe.content.get_value_for_datastore(r))
+        self.assertEqual([u'Toast it twice'], r.get_steps())
+
+    def test_prefetch(self):
+        record_scrape(self.make_recipe('scraper'))
+        a = share_content(self.make_recipe('alice'))
+        a.put()
+
+        recipes = prefetch_content([Recipe.get(a.key())])
+        self.assertEqual(a.content.key(), recipes[0].content.key())
+        self.assertEqual([u'Toast it'], recipes[0].get_steps())
+
+    def test_fresh(self):
+        self.assertEqual(None, get_fresh_content('http://example.com/fresh'))
+
+        content = record_scrape(
+            self.make_recipe('alice', 'http://example.com/fresh'))
+        self.assertEqual(content.key(),
+            get_fresh_content('http://EXAMPLE.com/fresh#top').key())
@@ -0,0 +1,103 @@
+from ..fatsecret import CoalescingFatSecret, FatSecretError, normalize_kwargs
+import threading
+import unittest
+
+class _SlowFatSecret(object):
+    '''
+    Stand-in for FatSecret that blocks every call until released.
+    '''
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def foods_search(self, **kwargs):
+        self.calls += [kwargs]
+        self.release.wait()
+
+        if kwargs['search_expression'] == 'error':
+            raise FatSecretError(code=1, message='boom')
+
+        return {'foods': {'search_expression': kwargs['search_expression']}}
+
+
+class CoalescingFatSecretTestCase(unittest.TestCase):
+
+    def run_threads(self, fs, cfs, kwargs_list):
+        results = [None] * len(kwargs_list)
+
+        def run_f(n, kwargs):
+            try:
+                results[n] = cfs.foods_search(**kwargs)
+            except FatSecretError, e:
+                results[n] = e
+
+        threads = [
+            threading.Thread(target=run_f, args=(n, kwargs)) \
+                for n, kwargs in enumerate(kwargs_list)]
+        for t in threads:
+            t.start()
+
+        # Wait for every thread to either issue its request or block on
+        # someone else's before letting the requests complete
+        while len(fs.calls) + cfs.coalesced < len(kwargs_list):
+            threading.Event().wait(0.01)
+
+        fs.release.set()
+        for t in threads:
+            t.join()
+
+        return results
+
+    def test_coalesce(self):
+        fs = _SlowFatSecret()
+        cfs = CoalescingFatSecret(fs)
+
+        results = self.run_threads(
+            fs, cfs, [{'search_expression': 'garlic'}] * 5)
+
+        self.assertEqual(1, len(fs.calls))
+        self.assertEqual(1, cfs.requests)
+        self.assertEqual(4, cfs.coalesced)
+        for r in results:
+            self.assertTrue(r is results[0])
+
+    def test_distinct(self):
+        fs = _SlowFatSecret()
+        cfs = CoalescingFatSecret(fs)
+
+        results = self.run_threads(fs, cfs, [
+            {'search_expression': 'garlic'},
+            {'search_expression': 'olive oil'}])
+
+        self.assertEqual(2, len(fs.calls))
+        self.assertEqual('garlic', results[0]['foods']['search_expression'])
+        self.assertEqual('olive oil', results[1]['foods']['search_expression'])
+
+    def test_error(self):
+        fs = _SlowFatSecret()
+        cfs = CoalescingFatSecret(fs)
+
+        results = self.run_threads(
+            fs, cfs, [{'search_expression': 'error'}] * 3)
+
+        self.assertEqual(1, len(fs.calls))
+        for r in results:
+            self.assertTrue(isinstance(r, FatSecretError))
+
+    def test_not_a_cache(self):
+        fs = _SlowFatSecret()
+        fs.release.set()
+        cfs = CoalescingFatSecret(fs)
+
+        cfs.foods_search(search_expression='garlic')
+        cfs.foods_search(search_expression='garlic')
+        self.assertEqual(2, len(fs.calls))
+
+
+class NormalizeKwargsTestCase(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(
+            normalize_kwargs({'page_number': 0, 'search_expression': 'a'}),
+            normalize_kwargs({'search_expression': u'a', 'page_number': '0'}))
@@ -0,0 +1,53 @@
+from .. import instrument
+import unittest
+
+class InstrumentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = instrument.MemorySink()
+        instrument.configure(self.sink)
+
+    def tearDown(self):
+        instrument.configure(None)
+        instrument.set_trace_id(None)
+
+    def test_timer(self):
+        instrument.set_trace_id('abc')
+        with instrument.timer('foo'):
+            pass
+
+        self.assertEqual(['foo'], self.sink.timings.keys())
+        self.assertEqual('abc', self.sink.timings['foo'][0][1])
+
+    def test_timed(self):
+        @instrument.timed('bar')
+        def f(x):
+            return x * 2
+
+        self.assertEqual(4, f(2))
+        self.assertEqual(4, f(2))
+        self.assertEqual(2, len(self.sink.timings['bar']))
+
+    def test_incr(self):
+        instrument.incr('baz')
+        instrument.incr('baz', 2)
+        self.assertEqual(3, self.sink.counters['baz'])
+
+    def test_disabled(self):
+        instrument.configure(None)
+
+        with instrument.timer('foo'):
+            pass
+        instrument.incr('baz')
+
+        self.assertEqual({}, self.sink.timings)
+        self.assertEqual({}, self.sink.counters)
+
+    def test_percentile(self):
+        values = range(1, 11)
+        self.assertEqual(1, instrument.percentile(values, 0))
+        self.assertEqual(5, instrument.percentile(values, 50))
+        self.assertEqual(9, instrument.percentile(values, 90))
+        self.assertEqual(10, instrument.percentile(values, 99))
+        self.assertEqual(3, instrument.percentile([3], 50))
+        self.assertEqual(None, instrument.percentile([], 50))
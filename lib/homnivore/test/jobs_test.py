@@ -0,0 +1,173 @@
+from .. import content
+from .. import jobs
+from .. import tasks
+from ..fatsecret import FatSecret
+from ..models import NutritionResult, Recipe, ScrapeJob
+from ..replay import ReplayTransport
+import datetime
+import json
+import os
+import unittest
+
+FIXTURE_PATH = os.path.join(
+    os.path.dirname(__file__), 'fixtures', 'fatsecret.json')
+
+class ComputeNutritionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = tasks.LocalQueue()
+        tasks.configure(self.queue)
+        jobs.set_backend(FatSecret(transport=ReplayTransport(FIXTURE_PATH)))
+
+    def tearDown(self):
+        tasks.configure(None)
+        jobs.set_backend(None)
+
+    def put_recipe(self, ingredients):
+        recipe = Recipe(
+            user_id='user', url='http://example.com/', name='Recipe',
+            ingredients=ingredients, steps=[])
+        recipe.put()
+        return recipe
+
+    def test_compute(self):
+        recipe = self.put_recipe([u'1 clove garlic', u'2 tbsp olive oil'])
+        tasks.defer(jobs.compute_nutrition, str(recipe.key()), 2)
+        self.assertEqual(None,
+            NutritionResult.get(NutritionResult.key_for(recipe.key())))
+
+        self.queue.run()
+        result = NutritionResult.get(NutritionResult.key_for(recipe.key()))
+        self.assertEqual(NutritionResult.DONE, result.status)
+        self.assertEqual(2, result.servings)
+
+        n = json.loads(result.nutrition)
+        self.assertEqual(242, n['total']['calories'])
+        self.assertEqual(121, n['per_serving']['calories'])
+        self.assertEqual(2, len(n['lines']))
+
+    def test_failure(self):
+        recipe = self.put_recipe([u'a pinch of salt'])
+        jobs.compute_nutrition(str(recipe.key()))
+
+        result = NutritionResult.get(NutritionResult.key_for(recipe.key()))
+        self.assertEqual(NutritionResult.FAILED, result.status)
+        self.assertTrue(result.error)
+
+
+class ScrapeRecipeTestCase(unittest.TestCase):
+
+    HTML = u'''<html>
+<head><title>Garlic Toast Recipe | MyRecipes.com</title></head>
+<body>
+<ul>
+<li itemprop="ingredient"><span itemprop="amount">2</span>
+  <span itemprop="name">cloves garlic</span>
+  <span itemprop="preparation">, minced</span></li>
+</ul>
+<ol itemprop="instructions"><li>1. Toast the bread.</li></ol>
+</body>
+</html>'''
+
+    def setUp(self):
+        self.queue = tasks.LocalQueue()
+        tasks.configure(self.queue)
+
+    def tearDown(self):
+        tasks.configure(None)
+
+    def test_scrape(self):
+        job = jobs.start_scrape(
+            'http://www.myrecipes.com/recipe/garlic-toast/', 'user',
+            html=self.HTML)
+        self.assertEqual(ScrapeJob.PENDING, job.status)
+
+        self.assertEqual(1, self.queue.run())
+        job = ScrapeJob.get(job.key())
+        self.assertEqual(ScrapeJob.DONE, job.status)
+        self.assertEqual(None, job.html)
+
+        recipe = job.get_recipe()
+        self.assertEqual('Garlic Toast', recipe.name)
+        self.assertEqual('user', recipe.user_id)
+        self.assertEqual([u'2 cloves garlic , minced'], recipe.ingredients)
+
+    def test_large_html(self):
+        job = jobs.start_scrape(
+            'http://www.myrecipes.com/recipe/garlic-toast/', 'user',
+            html=self.HTML + u' ' * jobs.MAX_HTML_SIZE)
+        self.assertEqual(None, job.html)
+
+    def test_transient_error(self):
+        def fail(*args, **kwargs):
+            raise IOError('timed out')
+
+        scrape_html = jobs.scrape_html
+        jobs.scrape_html = fail
+        try:
+            job = jobs.start_scrape(
+                'http://www.myrecipes.com/recipe/garlic-toast/', 'user',
+                html=self.HTML)
+            for n in range(1, jobs.MAX_SCRAPE_ATTEMPTS):
+                self.assertRaises(IOError, jobs.scrape_recipe, str(job.key()))
+                job = ScrapeJob.get(job.key())
+                self.assertEqual(ScrapeJob.PENDING, job.status)
+                self.assertEqual(n, job.attempts)
+
+            # The last attempt gives up
+            jobs.scrape_recipe(str(job.key()))
+            job = ScrapeJob.get(job.key())
+            self.assertEqual(ScrapeJob.FAILED, job.status)
+            self.assertTrue(job.error)
+        finally:
+            jobs.scrape_html = scrape_html
+
+    def test_expire(self):
+        job = jobs.start_scrape(
+            'http://www.myrecipes.com/recipe/garlic-toast/', 'user',
+            html=self.HTML)
+        self.assertEqual(ScrapeJob.PENDING, jobs.expire_scrape(job).status)
+
+        job.created -= datetime.timedelta(seconds=jobs.SCRAPE_TIMEOUT + 1)
+        self.assertEqual(ScrapeJob.FAILED, jobs.expire_scrape(job).status)
+
+    def test_no_recipe(self):
+        job = jobs.start_scrape(
+            'http://example.com/garlic-toast/', 'user', html=self.HTML)
+
+        self.queue.run()
+        job = ScrapeJob.get(job.key())
+        self.assertEqual(ScrapeJob.FAILED, job.status)
+        self.assertEqual(None, job.get_recipe())
+        self.assertTrue(job.error)
+
+    def test_fresh_content(self):
+        # As though the server had fetched and scraped the page itself
+        job = jobs.start_scrape(
+            'http://www.myrecipes.com/recipe/garlic-toast/', 'alice',
+            html=self.HTML)
+        self.queue.run()
+        content.record_scrape(ScrapeJob.get(job.key()).get_recipe())
+
+        # Another user clipping the same page gets the stored content without
+        # it being scraped again
+        job = jobs.start_scrape(
+            'http://www.myrecipes.com/recipe/garlic-toast/#reviews', 'bob')
+        self.assertEqual(ScrapeJob.DONE, job.status)
+        self.assertEqual(0, self.queue.run())
+        self.assertEqual('bob', job.get_recipe().user_id)
+        self.assertEqual('Garlic Toast', job.get_recipe().name)
+
+    def test_html_not_shared(self):
+        job = jobs.start_scrape(
+            'http://www.myrecipes.com/recipe/garlic-toast/', 'mallory',
+            html=self.HTML)
+        self.queue.run()
+        self.assertEqual(ScrapeJob.DONE, ScrapeJob.get(job.key()).status)
+
+        # What a browser sent is not given to anyone else
+        self.assertEqual(None, content.get_fresh_content(
+            'http://www.myrecipes.com/recipe/garlic-toast/'))
+        job = jobs.start_scrape(
+            'http://www.myrecipes.com/recipe/garlic-toast/', 'bob')
+        self.assertEqual(ScrapeJob.PENDING, job.status)
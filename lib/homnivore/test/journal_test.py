@@ -0,0 +1,61 @@
+from ..journal import Journal
+import os
+import shutil
+import tempfile
+import unittest
+
+class JournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'journal.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_resume(self):
+        j = Journal(self.path)
+        j.record(u'1 clove garlic', '36397', {'calories': 4.0})
+        j.record(u'2 tbsp olive oil', '33730', {'calories': 238.0})
+        j.close()
+
+        j = Journal(self.path)
+        self.assertEqual('36397', j.get(u'1 clove garlic')['food_id'])
+        self.assertEqual(
+            {'calories': 238.0}, j.get(u'2 tbsp olive oil')['nutrition'])
+        self.assertEqual(None, j.get(u'1 medium onion'))
+        j.close()
+
+    def test_normalized(self):
+        j = Journal(self.path)
+        j.record(u'1 clove garlic', '36397', {'calories': 4.0})
+        self.assertEqual('36397', j.get(u'  1 Clove  garlic ')['food_id'])
+        j.close()
+
+    def test_latest(self):
+        j = Journal(self.path)
+        j.record(u'1 clove garlic', '36397', {'calories': 4.0})
+        j.record(u'1 clove garlic', '36398', {'calories': 5.0})
+        j.close()
+
+        j = Journal(self.path)
+        self.assertEqual('36398', j.get(u'1 clove garlic')['food_id'])
+        j.close()
+
+    def test_interrupted_write(self):
+        j = Journal(self.path)
+        j.record(u'1 clove garlic', '36397', {'calories': 4.0})
+        j.close()
+
+        f = open(self.path, 'a')
+        f.write('{"food_id": "337')
+        f.close()
+
+        j = Journal(self.path)
+        self.assertEqual('36397', j.get(u'1 clove garlic')['food_id'])
+        j.record(u'2 tbsp olive oil', '33730', {'calories': 238.0})
+        j.close()
+
+        j = Journal(self.path)
+        self.assertEqual('33730', j.get(u'2 tbsp olive oil')['food_id'])
+        j.close()
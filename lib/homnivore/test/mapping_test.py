@@ -0,0 +1,59 @@
+from ..mapping import FoodMapping, normalize_name
+import os
+import shutil
+import tempfile
+import unittest
+
+class NormalizeNameTestCase(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(u'garlic clove', normalize_name(u'Garlic  Cloves'))
+        self.assertEqual(u'all purpose flour',
+            normalize_name(u'all-purpose flour'))
+        self.assertEqual(u'grass', normalize_name(u'grass'))
+
+
+class FoodMappingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_exact(self):
+        m = FoodMapping()
+        m.put(u'chicken breasts', '1641')
+        self.assertEqual('1641', m.get(u'Chicken Breast'))
+        self.assertEqual(('1641', u'chicken breast'),
+            m.match(u'chicken breast'))
+        self.assertEqual(None, m.get(u'chicken'))
+
+    def test_fuzzy(self):
+        m = FoodMapping()
+        m.put(u'extra virgin olive oil', '33885')
+        m.put(u'chicken broth', '6443')
+        self.assertEqual(('33885', u'extra virgin olive oil'),
+            m.match(u'extra-virgin olive oils'))
+        self.assertEqual(('6443', u'chicken broth'),
+            m.match(u'chicken brothe'))
+        self.assertEqual(None, m.match(u'olive'))
+        self.assertEqual(None, m.match(u'beef broth'))
+
+    def test_fuzzy_not_exact(self):
+        m = FoodMapping()
+        m.put(u'salted butter', '33814')
+        self.assertEqual(None, m.get(u'unsalted butter'))
+        self.assertEqual(('33814', u'salted butter'),
+            m.match(u'unsalted butter'))
+
+    def test_save(self):
+        path = os.path.join(self.dir, 'mapping.json')
+
+        m = FoodMapping(path)
+        m.put(u'garlic', '36397')
+        m.save()
+
+        m = FoodMapping(path)
+        self.assertEqual('36397', m.get(u'garlic'))
+        self.assertEqual(('36397', u'garlic'), m.match(u'garlics'))
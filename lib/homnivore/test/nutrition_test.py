@@ -0,0 +1,144 @@
+from ..fatsecret import FatSecret, FatSecretError
+from ..nutrition import LocalBackend, TieredBackend, describe_food
+from ..recipe import get_ingredient_nutrition
+from ..replay import ReplayMissError, ReplayTransport
+import json
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+FIXTURE_PATH = os.path.join(
+    os.path.dirname(__file__), 'fixtures', 'fatsecret.json')
+
+class LocalBackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.backend = LocalBackend(os.path.join(self.dir, 'foods.db'))
+        self.backend.import_fixture(open(FIXTURE_PATH, 'r'))
+
+        self.fs = FatSecret(transport=ReplayTransport(FIXTURE_PATH))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_food_get(self):
+        self.assertEqual(
+            self.fs.food_get(food_id='36397')['food']['servings'],
+            self.backend.food_get(food_id='36397')['food']['servings'])
+
+        self.assertRaises(FatSecretError, self.backend.food_get, food_id='1')
+
+    def test_search(self):
+        foods = self.backend.foods_search(search_expression='Garlic')['foods']
+        self.assertEqual('1', foods['total_results'])
+        expected = self.fs.foods_search(
+            search_expression='garlic')['foods']['food'][0]
+        del expected['food_url']
+        self.assertEqual(expected, foods['food'][0])
+
+        foods = self.backend.foods_search(search_expression='chicken')['foods']
+        self.assertEqual('2', foods['total_results'])
+        self.assertEqual(
+            ['Chicken Broth', 'Chicken Breast'],
+            [f['food_name'] for f in foods['food']])
+
+        foods = self.backend.foods_search(
+            search_expression='chicken', page_number=1, max_results=1)['foods']
+        self.assertEqual(
+            ['Chicken Breast'], [f['food_name'] for f in foods['food']])
+
+        foods = self.backend.foods_search(search_expression='tofu')['foods']
+        self.assertEqual('0', foods['total_results'])
+        self.assertFalse('food' in foods)
+
+    def test_nutrition(self):
+        for l in ['2 cloves garlic', '1 lb chicken breast', '2 large eggs']:
+            self.assertEqual(
+                get_ingredient_nutrition(l, self.fs),
+                get_ingredient_nutrition(l, self.backend))
+
+    def test_import_dump(self):
+        food = self.fs.food_get(food_id='36397')['food']
+        food['food_id'] = '1'
+        food['food_name'] = 'Elephant Garlic'
+
+        n = self.backend.import_dump(StringIO.StringIO(
+            '\n' + json.dumps(food) + '\n{"food_id": "2"}\n'))
+        self.assertEqual(1, n)
+
+        foods = self.backend.foods_search(search_expression='garlic')['foods']
+        self.assertEqual(['Garlic', 'Elephant Garlic'],
+            [f['food_name'] for f in foods['food']])
+        self.assertEqual(
+            describe_food(food), foods['food'][1]['food_description'])
+
+
+class _CountingBackend(object):
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = []
+
+    def foods_search(self, **kwargs):
+        self.calls += [('foods_search', kwargs)]
+        return self.backend.foods_search(**kwargs)
+
+    def food_get(self, food_id):
+        self.calls += [('food_get', food_id)]
+        return self.backend.food_get(food_id=food_id)
+
+
+class TieredBackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'foods.db')
+        self.remote = _CountingBackend(
+            FatSecret(transport=ReplayTransport(FIXTURE_PATH)))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lru(self):
+        tb = TieredBackend(self.remote, lru_size=1)
+        expected = tb.food_get(food_id='36397')
+        self.assertEqual(expected, tb.food_get(food_id=36397))
+        self.assertEqual(1, len(self.remote.calls))
+
+        # Evicted
+        tb.food_get(food_id='33885')
+        tb.food_get(food_id='36397')
+        self.assertEqual(3, len(self.remote.calls))
+
+        stats = tb.stats()
+        self.assertEqual(1, stats['lru']['hits'])
+        self.assertEqual(0.25, stats['lru']['hit_ratio'])
+        self.assertEqual(3, stats['remote']['hits'])
+        self.assertEqual(None, stats['local']['hit_ratio'])
+
+    def test_write_back(self):
+        tb = TieredBackend(self.remote, LocalBackend(self.path))
+        ni = get_ingredient_nutrition('2 cloves garlic', tb)
+        self.assertEqual(2, len(self.remote.calls))
+        self.assertEqual(2, tb.stats()['local']['misses'])
+
+        # A new process starts with an empty LRU but the same local store
+        tb = TieredBackend(self.remote, LocalBackend(self.path))
+        self.assertEqual(ni, get_ingredient_nutrition('2 cloves garlic', tb))
+        self.assertEqual(2, len(self.remote.calls))
+        self.assertEqual(1.0, tb.stats()['local']['hit_ratio'])
+        self.assertEqual(0, tb.stats()['remote']['hits'])
+
+    def test_remote_error(self):
+        tb = TieredBackend(self.remote, LocalBackend(self.path))
+        self.assertRaises(ReplayMissError, tb.food_get, food_id='1')
+        self.assertRaises(ReplayMissError, tb.food_get, food_id='1')
+        self.assertEqual(2, len(self.remote.calls))
+
+        stats = tb.stats()
+        self.assertEqual(0, stats['remote']['hits'])
+        self.assertEqual(2, stats['remote']['errors'])
+        self.assertEqual(None, stats['remote']['hit_ratio'])
@@ -0,0 +1,76 @@
+from ..prefetch import Prefetcher
+from multiprocessing.pool import ThreadPool
+import threading
+import unittest
+
+class FakeFatSecret(object):
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    def food_get(self, food_id):
+        self.calls += [food_id]
+        if self.error:
+            raise self.error
+        return {'food_id': food_id}
+
+class PrefetchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ThreadPool(1)
+        self.demand_pool = ThreadPool(1)
+
+    def tearDown(self):
+        self.pool.terminate()
+        self.demand_pool.terminate()
+
+    def block(self, pool):
+        gate = threading.Event()
+        pool.apply_async(gate.wait)
+        return gate
+
+    def race(self, fs):
+        '''
+        Queue a speculative call and then an on-demand call for the same food,
+        and let the speculative one start first. Return the AsyncResults of
+        both.
+        '''
+
+        p = Prefetcher(fs, self.pool, self.demand_pool, 10, 3)
+
+        pool_gate = self.block(self.pool)
+        demand_gate = self.block(self.demand_pool)
+        spec = p.prefetch_food('33885')
+        demand = p.prefetch_food('33885', demand=True)
+
+        pool_gate.set()
+        try:
+            spec.get(5)
+        except Exception:
+            pass
+        demand_gate.set()
+
+        return spec, demand
+
+    def test_speculative_wins(self):
+        fs = FakeFatSecret()
+        spec, demand = self.race(fs)
+
+        self.assertEqual({'food_id': '33885'}, demand.get(5))
+        self.assertEqual(['33885'], fs.calls)
+
+    def test_speculative_wins_error(self):
+        fs = FakeFatSecret(ValueError('no such food'))
+        spec, demand = self.race(fs)
+
+        self.assertRaises(ValueError, demand.get, 5)
+        self.assertEqual(['33885'], fs.calls)
+
+    def test_demand(self):
+        fs = FakeFatSecret()
+        p = Prefetcher(fs, self.pool, self.demand_pool, 10, 3)
+
+        self.block(self.pool)
+        self.assertEqual({'food_id': '33885'}, p.food_get('33885'))
+        self.assertEqual(['33885'], fs.calls)
@@ -0,0 +1,65 @@
+from ..fatsecret import FatSecret, FatSecretError, OAuthTransport
+from ..replay import FixtureStore, RecordingTransport, ReplayMissError, \
+    ReplayTransport, StandInServer
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+FIXTURE_PATH = os.path.join(
+    os.path.dirname(__file__), 'fixtures', 'fatsecret.json')
+
+class _CannedTransport(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, params):
+        self.calls += 1
+        return json.dumps({'food': {'food_id': params['food_id']}})
+
+
+class ReplayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_record_replay(self):
+        path = os.path.join(self.dir, 'fixture.json')
+
+        canned = _CannedTransport()
+        fs = FatSecret(
+            transport=RecordingTransport(canned, FixtureStore(path)))
+        expected = fs.food_get(food_id='1234')
+
+        fs = FatSecret(transport=ReplayTransport(path))
+        self.assertEqual(expected, fs.food_get(food_id=1234))
+        self.assertEqual(1, canned.calls)
+
+        self.assertRaises(ReplayMissError, fs.food_get, food_id='5678')
+
+    def test_search_defaults(self):
+        fs = FatSecret(transport=ReplayTransport(FIXTURE_PATH))
+
+        self.assertEqual(
+            fs.foods_search(search_expression='garlic'),
+            fs.foods_search(
+                search_expression='garlic', page_number=0, max_results=20))
+
+    def test_stand_in_server(self):
+        server = StandInServer(FIXTURE_PATH).start()
+        try:
+            fs = FatSecret(
+                transport=OAuthTransport('key', 'secret', server.endpoint))
+
+            food = fs.food_get(food_id='36397')
+            self.assertEqual('Garlic', food['food']['food_name'])
+
+            self.assertRaises(FatSecretError, fs.food_get, food_id='1')
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -1,4 +1,4 @@
-from ..scrape import scrape
+from ..scrape import scrape, scrape_html
 import unittest
 
 class ScrapeTestCase(unittest.TestCase):
@@ -16,3 +16,36 @@ class ScrapeTestCase(unittest.TestCase):
         self.assertEqual('1/2 cup chopped shallots', r.ingredients[0])
         self.assertEqual(3, len(r.steps))
         self.assertTrue(r.steps[2].startswith('Heat a large saucepan'))
+
+    def test_scrape_html(self):
+        html = u'''<html>
+<head><title>Garlic Toast Recipe | MyRecipes.com</title></head>
+<body>
+<img alt="Garlic Toast Recipe" src="http://example.com/toast.jpg"/>
+<ul>
+<li itemprop="ingredient"><span itemprop="amount">2</span>
+  <span itemprop="name">cloves garlic</span>
+  <span itemprop="preparation">, minced</span></li>
+<li itemprop="ingredient"><span itemprop="amount">\u00bd</span>
+  <span itemprop="name">cup olive oil</span>
+  <span itemprop="preparation">, divided</span></li>
+</ul>
+<ol itemprop="instructions"><li>1. Toast the bread.</li></ol>
+</body>
+</html>'''
+
+        r = scrape_html(
+            'http://www.myrecipes.com/recipe/garlic-toast/', html,
+            'asdddddddddddddd')
+
+        self.assertEqual('Garlic Toast', r.name)
+        self.assertEqual('asdddddddddddddd', r.user_id)
+        self.assertEqual(
+            [u'2 cloves garlic , minced', u'\u00bd cup olive oil , divided'],
+            r.ingredients)
+        self.assertEqual(['Toast the bread.'], r.steps)
+        self.assertEqual('http://example.com/toast.jpg', r.image)
+
+    def test_scrape_html_unknown_host(self):
+        self.assertEqual(
+            None, scrape_html('http://example.com/', u'<html/>', 'a'))
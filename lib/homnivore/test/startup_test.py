@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+GAE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'gae')
+
+# Modules that the web app should only load when a route or job that needs
+# them is first run
+HEAVY_MODULES = ['lxml', 'homnivore.recipe', 'oauth2', 'sqlite3']
+
+class StartupTestCase(unittest.TestCase):
+
+    def loaded(self, *modules):
+        '''
+        Import the given web app modules in a fresh interpreter, returning
+        which of HEAVY_MODULES were loaded as a result.
+        '''
+
+        script = \
+            'import json, sys; sys.path.insert(0, %r); ' % GAE_DIR + \
+            ''.join('import %s; ' % m for m in modules) + \
+            'json.dump([m for m in %r if m in sys.modules], sys.stdout)' % \
+                HEAVY_MODULES
+
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        return json.loads(
+            subprocess.check_output([sys.executable, '-c', script], env=env))
+
+    def test_main(self):
+        self.assertEqual([], self.loaded('main'))
+
+    def test_clipping(self):
+        self.assertEqual([], self.loaded('main', 'clipping'))
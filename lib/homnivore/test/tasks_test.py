@@ -0,0 +1,53 @@
+from .. import tasks
+import threading
+import unittest
+
+_calls = []
+
+def _task(*args, **kwargs):
+    _calls.append((args, kwargs))
+
+def _chain_task(n):
+    _calls.append(n)
+    if n > 0:
+        tasks.defer(_chain_task, n - 1)
+
+def _failing_task():
+    raise ValueError('boom')
+
+
+class LocalQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        del _calls[:]
+        self.queue = tasks.LocalQueue()
+        tasks.configure(self.queue)
+
+    def tearDown(self):
+        tasks.configure(None)
+
+    def test_deferred(self):
+        tasks.defer(_task, 1, 'a', b=2)
+        self.assertEqual([], _calls)
+
+        self.assertEqual(1, self.queue.run())
+        self.assertEqual([((1, 'a'), {'b': 2})], _calls)
+        self.assertEqual(0, self.queue.run())
+
+    def test_chained(self):
+        tasks.defer(_chain_task, 2)
+        self.assertEqual(3, self.queue.run())
+        self.assertEqual([2, 1, 0], _calls)
+
+    def test_failure(self):
+        tasks.defer(_failing_task)
+        tasks.defer(_task)
+        self.assertRaises(ValueError, self.queue.run)
+        self.assertEqual(1, self.queue.run())
+
+    def test_threaded(self):
+        done = threading.Event()
+        queue = tasks.LocalQueue(threaded=True)
+        queue.defer(done.set)
+        done.wait(5)
+        self.assertTrue(done.is_set())
@@ -39,7 +39,11 @@ import urllib
 import base64
 import os
 import copy
+import struct
+import threading
+import Queue
 import calendar
+import collections
 import time
 import random
 import errno
@@ -67,17 +71,51 @@ except ImportError:
 try:
     import ssl # python 2.6
     ssl_SSLError = ssl.SSLError
-    def _ssl_wrap_socket(sock, key_file, cert_file,
-                         disable_validation, ca_certs):
-        if disable_validation:
-            cert_reqs = ssl.CERT_NONE
-        else:
-            cert_reqs = ssl.CERT_REQUIRED
-        # We should be specifying SSL version 3 or TLS v1, but the ssl module
-        # doesn't expose the necessary knobs. So we need to go with the default
-        # of SSLv23.
-        return ssl.wrap_socket(sock, keyfile=key_file, certfile=cert_file,
-                               cert_reqs=cert_reqs, ca_certs=ca_certs)
+    if hasattr(ssl, 'SSLContext'): # python 2.7.9
+        # Contexts by (key_file, cert_file, disable_validation, ca_certs), so
+        # that the CA certificates are only loaded once
+        _ssl_contexts = {}
+        _ssl_contexts_lock = threading.Lock()
+
+        def _get_ssl_context(key_file, cert_file, disable_validation,
+                             ca_certs):
+            key = (key_file, cert_file, disable_validation, ca_certs)
+            context = _ssl_contexts.get(key)
+            if context is not None:
+                return context
+            _ssl_contexts_lock.acquire()
+            try:
+                context = _ssl_contexts.get(key)
+                if context is None:
+                    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+                    if disable_validation:
+                        context.verify_mode = ssl.CERT_NONE
+                    else:
+                        context.verify_mode = ssl.CERT_REQUIRED
+                        context.load_verify_locations(ca_certs)
+                    if cert_file:
+                        context.load_cert_chain(cert_file, key_file)
+                    _ssl_contexts[key] = context
+            finally:
+                _ssl_contexts_lock.release()
+            return context
+
+        def _ssl_wrap_socket(sock, key_file, cert_file,
+                             disable_validation, ca_certs):
+            return _get_ssl_context(key_file, cert_file, disable_validation,
+                                    ca_certs).wrap_socket(sock)
+    else:
+        def _ssl_wrap_socket(sock, key_file, cert_file,
+                             disable_validation, ca_certs):
+            if disable_validation:
+                cert_reqs = ssl.CERT_NONE
+            else:
+                cert_reqs = ssl.CERT_REQUIRED
+            # We should be specifying SSL version 3 or TLS v1, but the ssl module
+            # doesn't expose the necessary knobs. So we need to go with the default
+            # of SSLv23.
+            return ssl.wrap_socket(sock, keyfile=key_file, certfile=cert_file,
+                                   cert_reqs=cert_reqs, ca_certs=ca_certs)
 except (AttributeError, ImportError):
     ssl_SSLError = None
     def _ssl_wrap_socket(sock, key_file, cert_file,
@@ -102,7 +140,7 @@ def has_timeout(timeout): # python 2.6
         return (timeout is not None and timeout is not socket._GLOBAL_DEFAULT_TIMEOUT)
     return (timeout is not None)
 
-__all__ = ['Http', 'Response', 'ProxyInfo', 'HttpLib2Error',
+__all__ = ['Http', 'Response', 'StreamingBody', 'ProxyInfo', 'HttpLib2Error',
   'RedirectMissingLocation', 'RedirectLimit', 'FailedToDecompressContent',
   'UnimplementedDigestAuthOptionError', 'UnimplementedHmacDigestAuthOptionError',
   'debuglevel', 'ProxiesUnavailableError']
@@ -180,6 +218,9 @@ class CertificateHostnameMismatch(SSLHandshakeError):
 # requesting that URI again.
 DEFAULT_MAX_REDIRECTS = 5
 
+# The maximum number of connections that Http.prewarm() opens at once
+PREWARM_THREADS = 8
+
 # Default CA certificates file bundled with httplib2.
 CA_CERTS = os.path.join(
         os.path.dirname(os.path.abspath(__file__ )), "cacerts.txt")
@@ -192,6 +233,121 @@ def _get_end2end_headers(response):
     hopbyhop.extend([x.strip() for x in response.get('connection', '').split(',')])
     return [header for header in response.keys() if header not in hopbyhop]
 
+class LRUCache(object):
+    """A bounded memo of computed values, with hit rate counters.
+
+    When full, the least recently used half of the entries is evicted in
+    one go, which keeps the cost of a hit down to a dictionary lookup.
+    Safe to use from multiple threads (though the counters are not exact
+    under contention).
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Return the value for 'key', calling compute(key) to create it
+        if it's not in the cache. Exceptions raised by compute() are
+        propagated and nothing is cached."""
+        self._tick += 1
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[1] = self._tick
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = compute(key)
+        self._lock.acquire()
+        try:
+            self._entries[key] = [value, self._tick]
+            if len(self._entries) > self.maxsize:
+                entries = sorted(self._entries.iteritems(), key=lambda x: x[1][1])
+                self._entries = dict(entries[len(entries) - self.maxsize / 2:])
+        finally:
+            self._lock.release()
+        return value
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries = {}
+            self.hits = 0
+            self.misses = 0
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'hit_rate': total and float(self.hits) / total or 0.0}
+
+class DNSCache(object):
+    """A memo of socket.getaddrinfo() results that expire after 'ttl'
+    seconds, shared by all connections so that reconnecting to a host
+    doesn't resolve its name again. Failed lookups are not cached. Set
+    'ttl' to 0 to disable caching.
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def getaddrinfo(self, host, port, family=0, socktype=0):
+        key = (host, port, family, socktype)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.time():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        results = socket.getaddrinfo(host, port, family, socktype)
+        if self.ttl > 0:
+            self._lock.acquire()
+            try:
+                self._entries[key] = (time.time() + self.ttl, results)
+            finally:
+                self._lock.release()
+        return results
+
+    def invalidate(self, host, port):
+        """Forget the addresses of the given host and port, e.g. because
+        none of them could be connected to."""
+        self._lock.acquire()
+        try:
+            for key in self._entries.keys():
+                if key[:2] == (host, port):
+                    del self._entries[key]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries = {}
+            self.hits = 0
+            self.misses = 0
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'hit_rate': total and float(self.hits) / total or 0.0}
+
+# Resolved addresses, shared by all connections
+DNS_CACHE = DNSCache()
+
 URI = re.compile(r"^(([^:/?#]+):)?(//([^/?#]*))?([^?#]*)(\?([^#]*))?(#(.*))?")
 
 def parse_uri(uri):
@@ -217,6 +373,19 @@ def urlnorm(uri):
     defrag_uri = scheme + "://" + authority + request_uri
     return scheme, authority, request_uri, defrag_uri
 
+def _normalize_uri(uri):
+    uri = iri2uri(uri)
+    return (uri,) + urlnorm(uri)
+
+# Memo of request URIs to the (uri, scheme, authority, request_uri,
+# defrag_uri) tuple computed from them by iri2uri() and urlnorm()
+URI_CACHE = LRUCache(1024)
+
+
+# Memo of whether a certificate (in DER form) is valid for a hostname, keyed
+# by (certificate, hostname)
+CERT_HOSTNAME_CACHE = LRUCache(256)
+
 
 # Cache filename construction (original borrowed from Venus http://intertwingly.net/code/venus/)
 re_url_scheme    = re.compile(r'^\w+://')
@@ -228,7 +397,9 @@ def safename(filename):
     Strips dangerous and common characters to create a filename we
     can use to store the cache in.
     """
+    return SAFENAME_CACHE.get(filename, _safename)
 
+def _safename(filename):
     try:
         if re_url_scheme.match(filename):
             if isinstance(filename,str):
@@ -249,6 +420,9 @@ def safename(filename):
         filename=filename[:200]
     return ",".join((filename, filemd5))
 
+# Memo of cache keys to the filenames computed from them by safename()
+SAFENAME_CACHE = LRUCache(1024)
+
 NORMALIZE_SPACE = re.compile(r'(?:\r\n)?[ \t]+')
 def _normalize_headers(headers):
     return dict([ (key.lower(), NORMALIZE_SPACE.sub(value, ' ').strip())  for (key, value) in headers.iteritems()])
@@ -398,6 +572,200 @@ def _decompressContent(response, new_content):
         raise FailedToDecompressContent(_("Content purported to be compressed with %s but failed to decompress.") % response.get('content-encoding'), response, content)
     return content
 
+# Size of the chunks read from the connection when streaming a response body
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class StreamingBody(object):
+    """A file-like response body that is read from the connection on demand,
+    decompressing it incrementally if necessary. This keeps memory use
+    bounded regardless of the size of the body.
+
+    Supports read(), iteration over chunks of the body (e.g. to feed an
+    incremental parser) and close(). Closing the body before it has been
+    read in its entirety closes the underlying connection, as it can't be
+    re-used for another request until the body has been consumed.
+    """
+    def __init__(self, source, response=None, encoding=None, conn=None):
+        self._source = source
+        self._response = response
+        self._encoding = encoding
+        self._conn = conn
+        self._decompressor = None
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        # Decompressed data not yet read, as a list of chunks of which the
+        # first self._offset bytes have been read
+        self._chunks = collections.deque()
+        self._offset = 0
+        self._buffered = 0
+        self._eof = False
+
+    def _append(self, data):
+        if data:
+            self._chunks.append(data)
+            self._buffered += len(data)
+
+    def _fill(self):
+        # Inflate at most a chunk at a time, keeping any compressed input
+        # that would inflate to more, so that a highly compressed body can't
+        # balloon in memory
+        if self._decompressor and self._decompressor.unconsumed_tail:
+            data = self._decompressor.unconsumed_tail
+        else:
+            data = self._source.read(STREAM_CHUNK_SIZE)
+            if not data:
+                self._eof = True
+                if self._decompressor:
+                    self._append(self._decompressor.flush())
+                self._source.close()
+                return
+        if self._decompressor:
+            try:
+                data = self._decompressor.decompress(data, STREAM_CHUNK_SIZE)
+            except zlib.error:
+                self.close()
+                raise FailedToDecompressContent(_("Content purported to be compressed with %s but failed to decompress.") % self._encoding, self._response, "")
+        self._append(data)
+
+    def _take(self, amt):
+        parts = []
+        needed = amt
+        while needed and self._chunks:
+            chunk = self._chunks[0]
+            available = len(chunk) - self._offset
+            if available <= needed:
+                parts.append(self._offset and chunk[self._offset:] or chunk)
+                self._chunks.popleft()
+                self._offset = 0
+                needed -= available
+            else:
+                parts.append(chunk[self._offset:self._offset + needed])
+                self._offset += needed
+                needed = 0
+        self._buffered -= amt - needed
+        return "".join(parts)
+
+    def read(self, amt=None):
+        if amt is None or amt < 0:
+            while not self._eof:
+                self._fill()
+            return self._take(self._buffered)
+        while self._buffered < amt and not self._eof:
+            self._fill()
+        return self._take(amt)
+
+    def __iter__(self):
+        while True:
+            data = self.read(STREAM_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+
+    def close(self):
+        if not self._eof:
+            self._eof = True
+            self._source.close()
+            if self._conn:
+                self._conn.close()
+        self._chunks.clear()
+        self._offset = 0
+        self._buffered = 0
+
+def _streamContent(response, source, conn):
+    """Like _decompressContent(), but returns a StreamingBody that reads
+    and decompresses the body from 'source' on demand."""
+    encoding = response.get('content-encoding', None)
+    if encoding in ['gzip', 'deflate']:
+        # The length of the decompressed content isn't known yet
+        if response.has_key('content-length'):
+            del response['content-length']
+        # Record the historical presence of the encoding in a way the won't interfere.
+        response['-content-encoding'] = response['content-encoding']
+        del response['content-encoding']
+    else:
+        encoding = None
+    return StreamingBody(source, response, encoding, conn)
+
+# Cache entries are stored in a compact, versioned binary format:
+#
+#   magic (4 bytes), version (1 byte), status (2 bytes), header count (2 bytes)
+#   for each header: key length (2 bytes), key, value length (4 bytes), value
+#   body
+#
+# All integers are unsigned and in network byte order. Entries written by
+# older versions (email-style headers, a blank line, then the body) are still
+# read transparently.
+CACHE_ENTRY_MAGIC = "\x00h2c"
+CACHE_ENTRY_VERSION = 1
+_CACHE_ENTRY_PREAMBLE = struct.Struct("!4sBHH")
+_CACHE_ENTRY_KEY_LENGTH = struct.Struct("!H")
+_CACHE_ENTRY_VALUE_LENGTH = struct.Struct("!I")
+
+def _encode_cache_entry(status, headers, content):
+    """Serialize a response status, list of (key, value) header tuples and
+    body into a cache entry."""
+    parts = [_CACHE_ENTRY_PREAMBLE.pack(CACHE_ENTRY_MAGIC, CACHE_ENTRY_VERSION, status, len(headers))]
+    for key, value in headers:
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        else:
+            value = str(value)
+        parts.append(_CACHE_ENTRY_KEY_LENGTH.pack(len(key)))
+        parts.append(key)
+        parts.append(_CACHE_ENTRY_VALUE_LENGTH.pack(len(value)))
+        parts.append(value)
+    parts.append(content)
+    return "".join(parts)
+
+def _decode_cache_entry(value):
+    """Parse a cache entry into an (info, content) tuple, where info is a
+    dictionary of headers including 'status'.
+
+    Raises ValueError if the entry is corrupt."""
+    if not value.startswith(CACHE_ENTRY_MAGIC):
+        return _decode_legacy_cache_entry(value)
+
+    try:
+        magic, version, status, count = _CACHE_ENTRY_PREAMBLE.unpack_from(value, 0)
+        if version != CACHE_ENTRY_VERSION:
+            raise ValueError("Unknown cache entry version %d" % version)
+        offset = _CACHE_ENTRY_PREAMBLE.size
+        info = {'status': str(status)}
+        for i in xrange(count):
+            length, = _CACHE_ENTRY_KEY_LENGTH.unpack_from(value, offset)
+            offset += _CACHE_ENTRY_KEY_LENGTH.size
+            key = value[offset:offset + length]
+            offset += length
+            length, = _CACHE_ENTRY_VALUE_LENGTH.unpack_from(value, offset)
+            offset += _CACHE_ENTRY_VALUE_LENGTH.size
+            info[key] = value[offset:offset + length]
+            offset += length
+    except struct.error, e:
+        raise ValueError("Truncated cache entry: %s" % e)
+    if offset > len(value):
+        raise ValueError("Truncated cache entry")
+    return (info, value[offset:])
+
+def _decode_legacy_cache_entry(value):
+    # info = email.message_from_string(cached_value)
+    #
+    # Need to replace the line above with the kludge below
+    # to fix the non-existent bug not fixed in this
+    # bug report: http://mail.python.org/pipermail/python-bugs-list/2005-September/030289.html
+    try:
+        info, content = value.split('\r\n\r\n', 1)
+    except ValueError:
+        raise ValueError("Malformed cache entry")
+    feedparser = email.FeedParser.FeedParser()
+    feedparser.feed(info)
+    info = feedparser.close()
+    feedparser._parse = None
+    return (dict([(key.lower(), value) for (key, value) in info.items()]), content)
+
 def _updateCache(request_headers, response_headers, content, cache, cachekey):
     if cachekey:
         cc = _parse_cache_control(request_headers)
@@ -405,10 +773,10 @@ def _updateCache(request_headers, response_headers, content, cache, cachekey):
         if cc.has_key('no-store') or cc_response.has_key('no-store'):
             cache.delete(cachekey)
         else:
-            info = email.Message.Message()
+            headers = []
             for key, value in response_headers.iteritems():
                 if key not in ['status','content-encoding','transfer-encoding']:
-                    info[key] = value
+                    headers.append((key, value))
 
             # Add annotations to the cache to indicate what headers
             # are variant for this request.
@@ -418,7 +786,7 @@ def _updateCache(request_headers, response_headers, content, cache, cachekey):
                 for header in vary_headers:
                     key = '-varied-%s' % header
                     try:
-                        info[key] = request_headers[header]
+                        headers.append((key, request_headers[header]))
                     except KeyError:
                         pass
 
@@ -426,14 +794,7 @@ def _updateCache(request_headers, response_headers, content, cache, cachekey):
             if status == 304:
                 status = 200
 
-            status_header = 'status: %d\r\n' % status
-
-            header_str = info.as_string()
-
-            header_str = re.sub("\r(?!\n)|(?<!\r)\n", "\r\n", header_str)
-            text = "".join([status_header, header_str, content])
-
-            cache.set(cachekey, text)
+            cache.set(cachekey, _encode_cache_entry(status, headers, content))
 
 def _cnonce():
     dig = _md5("%s:%s" % (time.ctime(), ["0123456789"[random.randrange(0, 9)] for i in range(20)])).hexdigest()
@@ -860,7 +1221,7 @@ class HTTPConnectionWithTimeout(httplib.HTTPConnection):
             raise ProxiesUnavailableError(
                 'Proxy support missing but proxy use was requested!')
         msg = "getaddrinfo returns an empty list"
-        for res in socket.getaddrinfo(self.host, self.port, 0,
+        for res in DNS_CACHE.getaddrinfo(self.host, self.port, 0,
                 socket.SOCK_STREAM):
             af, socktype, proto, canonname, sa = res
             try:
@@ -887,6 +1248,7 @@ class HTTPConnectionWithTimeout(httplib.HTTPConnection):
                 continue
             break
         if not self.sock:
+            DNS_CACHE.invalidate(self.host, self.port)
             raise socket.error, msg
 
 class HTTPSConnectionWithTimeout(httplib.HTTPSConnection):
@@ -966,7 +1328,7 @@ class HTTPSConnectionWithTimeout(httplib.HTTPSConnection):
         "Connect to a host on a given (SSL) port."
 
         msg = "getaddrinfo returns an empty list"
-        for family, socktype, proto, canonname, sockaddr in socket.getaddrinfo(
+        for family, socktype, proto, canonname, sockaddr in DNS_CACHE.getaddrinfo(
             self.host, self.port, 0, socket.SOCK_STREAM):
             try:
                 if self.proxy_info and self.proxy_info.isgood():
@@ -985,9 +1347,12 @@ class HTTPSConnectionWithTimeout(httplib.HTTPSConnection):
                 if self.debuglevel > 0:
                     print "connect: (%s, %s)" % (self.host, self.port)
                 if not self.disable_ssl_certificate_validation:
-                    cert = self.sock.getpeercert()
                     hostname = self.host.split(':', 0)[0]
-                    if not self._ValidateCertificateHostname(cert, hostname):
+                    if not CERT_HOSTNAME_CACHE.get(
+                            (self.sock.getpeercert(True), hostname),
+                            lambda key: self._ValidateCertificateHostname(
+                                self.sock.getpeercert(), hostname)):
+                        cert = self.sock.getpeercert()
                         raise CertificateHostnameMismatch(
                             'Server presented certificate that does not match '
                             'host %s: %s' % (hostname, cert), hostname, cert)
@@ -1016,6 +1381,7 @@ class HTTPSConnectionWithTimeout(httplib.HTTPSConnection):
               continue
             break
         if not self.sock:
+          DNS_CACHE.invalidate(self.host, self.port)
           raise socket.error, msg
 
 SCHEME_TO_CONNECTION = {
@@ -1197,6 +1563,11 @@ and more.
 
         self.timeout = timeout
 
+        # Idle copies of this object used by request_many(), each with its
+        # own set of connections
+        self._workers = []
+        self._workers_lock = threading.Lock()
+
     def _auth_from_challenge(self, host, request_uri, headers, response, content):
         """A generator that creates Authorization objects
            that can be applied to requests.
@@ -1223,7 +1594,7 @@ and more.
         self.credentials.clear()
         self.authorizations = []
 
-    def _conn_request(self, conn, request_uri, method, body, headers):
+    def _conn_request(self, conn, request_uri, method, body, headers, stream=False):
         for i in range(2):
             try:
                 if conn.sock is None:
@@ -1271,6 +1642,16 @@ and more.
                     raise
             else:
                 content = ""
+                # Only stream successful responses; the bodies of others are
+                # needed to handle redirects and authentication and are
+                # usually small anyway.
+                if stream and method != "HEAD" and \
+                        isinstance(response, httplib.HTTPResponse) and \
+                        200 <= response.status < 300:
+                    source = response
+                    response = Response(response)
+                    content = _streamContent(response, source, conn)
+                    break
                 if method == "HEAD":
                     response.close()
                 else:
@@ -1282,7 +1663,7 @@ and more.
         return (response, content)
 
 
-    def _request(self, conn, host, absolute_uri, request_uri, method, body, headers, redirections, cachekey):
+    def _request(self, conn, host, absolute_uri, request_uri, method, body, headers, redirections, cachekey, stream=False):
         """Do the actual request using the connection object
         and also follow one level of redirects if necessary"""
 
@@ -1291,18 +1672,20 @@ and more.
         if auth:
             auth.request(method, request_uri, headers, body)
 
-        (response, content) = self._conn_request(conn, request_uri, method, body, headers)
+        (response, content) = self._conn_request(conn, request_uri, method, body, headers, stream)
 
         if auth:
             if auth.response(response, body):
+                if isinstance(content, StreamingBody):
+                    content.close()
                 auth.request(method, request_uri, headers, body)
-                (response, content) = self._conn_request(conn, request_uri, method, body, headers )
+                (response, content) = self._conn_request(conn, request_uri, method, body, headers, stream)
                 response._stale_digest = 1
 
         if response.status == 401:
             for authorization in self._auth_from_challenge(host, request_uri, headers, response, content):
                 authorization.request(method, request_uri, headers, body)
-                (response, content) = self._conn_request(conn, request_uri, method, body, headers, )
+                (response, content) = self._conn_request(conn, request_uri, method, body, headers, stream)
                 if response.status != 401:
                     self.authorizations.append(authorization)
                     authorization.response(response, body)
@@ -1339,7 +1722,7 @@ and more.
                         if response.status in [302, 303]:
                             redirect_method = "GET"
                             body = None
-                        (response, content) = self.request(location, redirect_method, body=body, headers = headers, redirections = redirections - 1)
+                        (response, content) = self.request(location, redirect_method, body=body, headers = headers, redirections = redirections - 1, stream = stream)
                         response.previous = old_response
                 else:
                     raise RedirectLimit("Redirected more times than rediection_limit allows.", response, content)
@@ -1347,7 +1730,9 @@ and more.
                 # Don't cache 206's since we aren't going to handle byte range requests
                 if not response.has_key('content-location'):
                     response['content-location'] = absolute_uri
-                _updateCache(headers, response, content, self.cache, cachekey)
+                # Streamed bodies are never held in memory, so can't be cached
+                if not isinstance(content, StreamingBody):
+                    _updateCache(headers, response, content, self.cache, cachekey)
 
         return (response, content)
 
@@ -1359,7 +1744,7 @@ and more.
 # including all socket.* and httplib.* exceptions.
 
 
-    def request(self, uri, method="GET", body=None, headers=None, redirections=DEFAULT_MAX_REDIRECTS, connection_type=None):
+    def request(self, uri, method="GET", body=None, headers=None, redirections=DEFAULT_MAX_REDIRECTS, connection_type=None, stream=False):
         """ Performs a single HTTP request.
 The 'uri' is the URI of the HTTP resource and can begin
 with either 'http' or 'https'. The value of 'uri' must be an absolute URI.
@@ -1379,6 +1764,13 @@ exception is 'redirections. The default is 5.
 The return value is a tuple of (response, content), the first
 being and instance of the 'Response' class, the second being
 a string that contains the response entity body.
+
+If 'stream' is true, the content is instead returned as a file-like
+StreamingBody that is read (and decompressed) from the connection
+incrementally. It must be read to the end or closed before this object
+is used to make another request to the same host. Streamed responses
+are not stored in the cache, though fresh cached responses are still
+returned (wrapped in a StreamingBody).
         """
         try:
             if headers is None:
@@ -1389,66 +1781,26 @@ a string that contains the response entity body.
             if not headers.has_key('user-agent'):
                 headers['user-agent'] = "Python-httplib2/%s (gzip)" % __version__
 
-            uri = iri2uri(uri)
-
-            (scheme, authority, request_uri, defrag_uri) = urlnorm(uri)
+            (uri, scheme, authority, request_uri, defrag_uri) = URI_CACHE.get(uri, _normalize_uri)
             domain_port = authority.split(":")[0:2]
             if len(domain_port) == 2 and domain_port[1] == '443' and scheme == 'http':
                 scheme = 'https'
                 authority = domain_port[0]
 
-            proxy_info = self._get_proxy_info(scheme, authority)
-
-            conn_key = scheme+":"+authority
-            if conn_key in self.connections:
-                conn = self.connections[conn_key]
-            else:
-                if not connection_type:
-                  connection_type = SCHEME_TO_CONNECTION[scheme]
-                certs = list(self.certificates.iter(authority))
-                if issubclass(connection_type, HTTPSConnectionWithTimeout):
-                    if certs:
-                        conn = self.connections[conn_key] = connection_type(
-                                authority, key_file=certs[0][0],
-                                cert_file=certs[0][1], timeout=self.timeout,
-                                proxy_info=proxy_info,
-                                ca_certs=self.ca_certs,
-                                disable_ssl_certificate_validation=
-                                        self.disable_ssl_certificate_validation)
-                    else:
-                        conn = self.connections[conn_key] = connection_type(
-                                authority, timeout=self.timeout,
-                                proxy_info=proxy_info,
-                                ca_certs=self.ca_certs,
-                                disable_ssl_certificate_validation=
-                                        self.disable_ssl_certificate_validation)
-                else:
-                    conn = self.connections[conn_key] = connection_type(
-                            authority, timeout=self.timeout,
-                            proxy_info=proxy_info)
-                conn.set_debuglevel(debuglevel)
+            conn = self._get_connection(scheme, authority, connection_type)
 
             if 'range' not in headers and 'accept-encoding' not in headers:
                 headers['accept-encoding'] = 'gzip, deflate'
 
-            info = email.Message.Message()
+            info = {}
             cached_value = None
             if self.cache:
                 cachekey = defrag_uri
                 cached_value = self.cache.get(cachekey)
                 if cached_value:
-                    # info = email.message_from_string(cached_value)
-                    #
-                    # Need to replace the line above with the kludge below
-                    # to fix the non-existent bug not fixed in this
-                    # bug report: http://mail.python.org/pipermail/python-bugs-list/2005-September/030289.html
                     try:
-                        info, content = cached_value.split('\r\n\r\n', 1)
-                        feedparser = email.FeedParser.FeedParser()
-                        feedparser.feed(info)
-                        info = feedparser.close()
-                        feedparser._parse = None
-                    except IndexError:
+                        info, content = _decode_cache_entry(cached_value)
+                    except ValueError:
                         self.cache.delete(cachekey)
                         cachekey = None
                         cached_value = None
@@ -1470,7 +1822,7 @@ a string that contains the response entity body.
                 vary_headers = vary.lower().replace(' ', '').split(',')
                 for header in vary_headers:
                     key = '-varied-%s' % header
-                    value = info[key]
+                    value = info.get(key, None)
                     if headers.get(header, None) != value:
                             cached_value = None
                             break
@@ -1480,7 +1832,7 @@ a string that contains the response entity body.
                     # Should cached permanent redirects be counted in our redirection count? For now, yes.
                     if redirections <= 0:
                       raise RedirectLimit("Redirected more times than rediection_limit allows.", {}, "")
-                    (response, new_content) = self.request(info['-x-permanent-redirect-url'], "GET", headers = headers, redirections = redirections - 1)
+                    (response, new_content) = self.request(info['-x-permanent-redirect-url'], "GET", headers = headers, redirections = redirections - 1, stream = stream)
                     response.previous = Response(info)
                     response.previous.fromcache = True
                 else:
@@ -1501,6 +1853,8 @@ a string that contains the response entity body.
                         response = Response(info)
                         if cached_value:
                             response.fromcache = True
+                        if stream:
+                            content = StreamingBody(StringIO.StringIO(content), response)
                         return (response, content)
 
                     if entry_disposition == "STALE":
@@ -1511,7 +1865,7 @@ a string that contains the response entity body.
                     elif entry_disposition == "TRANSPARENT":
                         pass
 
-                    (response, new_content) = self._request(conn, authority, uri, request_uri, method, body, headers, redirections, cachekey)
+                    (response, new_content) = self._request(conn, authority, uri, request_uri, method, body, headers, redirections, cachekey, stream)
 
                 if response.status == 304 and method == "GET":
                     # Rewrite the cache entry with the new end-to-end headers
@@ -1541,7 +1895,7 @@ a string that contains the response entity body.
                     response = Response(info)
                     content = ""
                 else:
-                    (response, content) = self._request(conn, authority, uri, request_uri, method, body, headers, redirections, cachekey)
+                    (response, content) = self._request(conn, authority, uri, request_uri, method, body, headers, redirections, cachekey, stream)
         except Exception, e:
             if self.force_exception_to_status_code:
                 if isinstance(e, HttpLib2ErrorWithResponse):
@@ -1568,9 +1922,175 @@ a string that contains the response entity body.
             else:
                 raise
 
+        if stream and not isinstance(content, StreamingBody):
+            content = StreamingBody(StringIO.StringIO(content), response)
 
         return (response, content)
 
+    def request_many(self, requests, max_connections=4):
+        """ Performs several independent HTTP requests concurrently.
+The 'requests' are a sequence, each element of which is either a URI or
+a dictionary of keyword arguments for request() (e.g. {'uri': ...,
+'method': 'POST', 'body': ...}).
+
+The requests are spread over up to 'max_connections' connections per
+host, which are kept and re-used by later calls. Each request is made
+with request(), so caching, redirects and authentication all apply.
+
+The return value is a list of (response, content) tuples in the same
+order as 'requests'. If any request raised an exception, the first such
+exception (in the order of 'requests') is raised once all of the
+requests have completed.
+        """
+        requests = [isinstance(r, basestring) and {'uri': r} or r for r in requests]
+        results = [None] * len(requests)
+        errors = [None] * len(requests)
+
+        work = Queue.Queue()
+        for i in range(len(requests)):
+            work.put(i)
+
+        def run_f():
+            worker = self._get_worker()
+            try:
+                while True:
+                    try:
+                        i = work.get_nowait()
+                    except Queue.Empty:
+                        break
+                    try:
+                        results[i] = worker.request(**requests[i])
+                    except Exception:
+                        errors[i] = sys.exc_info()
+            finally:
+                self._put_worker(worker)
+
+        threads = [threading.Thread(target=run_f) for i in range(min(max_connections, len(requests)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for e in errors:
+            if e:
+                raise e[0], e[1], e[2]
+        return results
+
+    def prewarm(self, uris, max_connections=0):
+        """ Opens connections ahead of a burst of requests.
+The 'uris' are a sequence of URIs (only the scheme and authority are used)
+to open connections to, in parallel, so that the first requests to each
+host don't pay for name resolution and the TCP and SSL handshakes one
+after another.
+
+A connection is opened for request() to use. If 'max_connections' is
+given, that many connections per host are also opened for request_many()
+to use.
+
+Connections that fail are left closed, to be retried (and the error
+reported) by the request that uses them. The return value is the number of
+connections opened.
+        """
+        hosts = []
+        for uri in uris:
+            (uri, scheme, authority, request_uri, defrag_uri) = URI_CACHE.get(uri, _normalize_uri)
+            domain_port = authority.split(":")[0:2]
+            if len(domain_port) == 2 and domain_port[1] == '443' and scheme == 'http':
+                scheme = 'https'
+                authority = domain_port[0]
+            if (scheme, authority) not in hosts:
+                hosts.append((scheme, authority))
+
+        workers = [self._get_worker() for i in range(max_connections)]
+        try:
+            work = Queue.Queue()
+            for client in [self] + workers:
+                for (scheme, authority) in hosts:
+                    conn = client._get_connection(scheme, authority)
+                    if conn.sock is None:
+                        work.put(conn)
+
+            opened = []
+            def run_f():
+                while True:
+                    try:
+                        conn = work.get_nowait()
+                    except Queue.Empty:
+                        break
+                    try:
+                        conn.connect()
+                        opened.append(conn)
+                    except (socket.error, httplib.HTTPException, HttpLib2Error):
+                        conn.close()
+
+            threads = [threading.Thread(target=run_f) for i in range(min(PREWARM_THREADS, work.qsize()))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            for worker in workers:
+                self._put_worker(worker)
+
+        return len(opened)
+
+    def _get_connection(self, scheme, authority, connection_type=None):
+        """Return the connection to use for the given scheme and authority,
+        creating (but not connecting) it if necessary.
+        """
+        conn_key = scheme+":"+authority
+        if conn_key in self.connections:
+            return self.connections[conn_key]
+
+        proxy_info = self._get_proxy_info(scheme, authority)
+        if not connection_type:
+          connection_type = SCHEME_TO_CONNECTION[scheme]
+        certs = list(self.certificates.iter(authority))
+        if issubclass(connection_type, HTTPSConnectionWithTimeout):
+            if certs:
+                conn = self.connections[conn_key] = connection_type(
+                        authority, key_file=certs[0][0],
+                        cert_file=certs[0][1], timeout=self.timeout,
+                        proxy_info=proxy_info,
+                        ca_certs=self.ca_certs,
+                        disable_ssl_certificate_validation=
+                                self.disable_ssl_certificate_validation)
+            else:
+                conn = self.connections[conn_key] = connection_type(
+                        authority, timeout=self.timeout,
+                        proxy_info=proxy_info,
+                        ca_certs=self.ca_certs,
+                        disable_ssl_certificate_validation=
+                                self.disable_ssl_certificate_validation)
+        else:
+            conn = self.connections[conn_key] = connection_type(
+                    authority, timeout=self.timeout,
+                    proxy_info=proxy_info)
+        conn.set_debuglevel(debuglevel)
+        return conn
+
+    def _get_worker(self):
+        self._workers_lock.acquire()
+        try:
+            if self._workers:
+                return self._workers.pop()
+        finally:
+            self._workers_lock.release()
+
+        # Share everything (credentials, cache, settings) except the
+        # connections
+        worker = copy.copy(self)
+        worker.connections = {}
+        worker._workers = []
+        return worker
+
+    def _put_worker(self, worker):
+        self._workers_lock.acquire()
+        try:
+            self._workers.append(worker)
+        finally:
+            self._workers_lock.release()
+
     def _get_proxy_info(self, scheme, authority):
         """Return a ProxyInfo instance (or None) based on the scheme
         and authority.
@@ -1587,44 +2107,68 @@ a string that contains the response entity body.
 
 
 class Response(dict):
-    """An object more like email.Message than httplib.HTTPResponse."""
-
-    """Is this response from our local cache"""
-    fromcache = False
-
-    """HTTP protocol version used by server. 10 for HTTP/1.0, 11 for HTTP/1.1. """
-    version = 11
-
-    "Status code returned by server. "
-    status = 200
+    """An object more like email.Message than httplib.HTTPResponse.
 
-    """Reason phrase returned by server."""
-    reason = "Ok"
+    Per-response attributes are declared in __slots__, so that responses
+    don't each carry an instance dictionary as well as their headers.
+    """
 
-    previous = None
+    __slots__ = ('fromcache', 'version', 'status', 'reason', 'previous',
+                 '_stale_digest')
 
     def __init__(self, info):
-        # info is either an email.Message or
-        # an httplib.HTTPResponse object.
+        # Is this response from our local cache
+        self.fromcache = False
+        # HTTP protocol version used by server. 10 for HTTP/1.0, 11 for HTTP/1.1.
+        self.version = 11
+        # Status code returned by server.
+        self.status = 200
+        # Reason phrase returned by server.
+        self.reason = "Ok"
+        self.previous = None
+
+        # info is either an email.Message, an httplib.HTTPResponse
+        # object, a dictionary or a list of (key, value) tuples. Where a
+        # header is repeated, the last value wins.
         if isinstance(info, httplib.HTTPResponse):
-            for key, value in info.getheaders():
-                self[key.lower()] = value
+            dict.update(self, [(key.lower(), value) for key, value in info.getheaders()])
             self.status = info.status
             self['status'] = str(self.status)
             self.reason = info.reason
             self.version = info.version
         elif isinstance(info, email.Message.Message):
-            for key, value in info.items():
-                self[key] = value
+            dict.update(self, info.items())
             self.status = int(self['status'])
         else:
-            for key, value in info.iteritems():
-                self[key] = value
+            dict.update(self, info)
             self.status = int(self.get('status', self.status))
 
+    def __copy__(self):
+        response = Response(self)
+        for name, value in self._attributes().iteritems():
+            setattr(response, name, value)
+        return response
+
+    def __deepcopy__(self, memo):
+        response = self.__copy__()
+        response.previous = copy.deepcopy(self.previous, memo)
+        return response
+
+    def __reduce__(self):
+        return (_rebuild_response, (self.items(), self._attributes()))
+
+    def _attributes(self):
+        return dict([(name, getattr(self, name)) for name in Response.__slots__
+                     if hasattr(self, name)])
 
     def __getattr__(self, name):
         if name == 'dict':
             return self
         else:
             raise AttributeError, name
+
+def _rebuild_response(items, attributes):
+    response = Response(items)
+    for name, value in attributes.iteritems():
+        setattr(response, name, value)
+    return response
@@ -0,0 +1,89 @@
+"""Tests for the httplib2 cache entry format."""
+import unittest
+
+import httplib2
+
+from httplib2.test import miniserver
+
+
+class DictCache(object):
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+
+class CacheEntryFormatTest(unittest.TestCase):
+    def testRoundTrip(self):
+        headers = [('content-type', 'text/plain'), ('etag', '"abc"'),
+                   ('x-unicode', u'caf\xe9')]
+        body = 'some\r\n\r\nbody\x00with binary'
+        entry = httplib2._encode_cache_entry(200, headers, body)
+        info, content = httplib2._decode_cache_entry(entry)
+        self.assertEqual('200', info['status'])
+        self.assertEqual('text/plain', info['content-type'])
+        self.assertEqual('"abc"', info['etag'])
+        self.assertEqual(u'caf\xe9'.encode('utf-8'), info['x-unicode'])
+        self.assertEqual(body, content)
+
+    def testLegacyEntry(self):
+        entry = 'status: 200\r\ncontent-type: text/plain\r\n' \
+                'etag: "abc"\r\n\r\nthe body'
+        info, content = httplib2._decode_cache_entry(entry)
+        self.assertEqual('200', info['status'])
+        self.assertEqual('"abc"', info['etag'])
+        self.assertEqual('the body', content)
+
+    def testLegacyCacheHit(self):
+        # Never touches the network, as the entry is fresh
+        cache = DictCache()
+        client = httplib2.Http(cache=cache)
+        cache.set('http://localhost:1/legacy',
+                  'status: 200\r\ncontent-type: text/plain\r\n\r\nold body')
+
+        response, body = client.request(
+            'http://localhost:1/legacy',
+            headers={'cache-control': 'only-if-cached'})
+        self.assertTrue(response.fromcache)
+        self.assertEqual('text/plain', response['content-type'])
+        self.assertEqual('old body', body)
+
+    def testCorruptEntry(self):
+        entry = httplib2._encode_cache_entry(200, [('etag', '"abc"')], '')
+        self.assertRaises(ValueError, httplib2._decode_cache_entry,
+                          entry[:-3])
+        self.assertRaises(ValueError, httplib2._decode_cache_entry,
+                          'no blank line')
+
+
+class CacheHitTest(unittest.TestCase):
+    def setUp(self):
+        self.httpd, self.port = miniserver.start_server(
+            miniserver.ThisDirHandler)
+        self.uri = 'http://localhost:%d/miniserver.py' % self.port
+
+    def tearDown(self):
+        self.httpd.shutdown()
+
+    def testCacheHit(self):
+        cache = DictCache()
+        client = httplib2.Http(cache=cache)
+        response, body = client.request(self.uri)
+        self.assertFalse(response.fromcache)
+
+        response, cached_body = client.request(
+            self.uri, headers={'cache-control': 'only-if-cached'})
+        self.assertTrue(response.fromcache)
+        self.assertEqual(200, response.status)
+        self.assertEqual(body, cached_body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tests for the shared DNS cache and Http.prewarm()."""
+import socket
+import unittest
+
+import httplib2
+
+from httplib2.test import miniserver
+
+
+class DNSCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = httplib2.DNSCache(ttl=60)
+
+    def testCache(self):
+        first = self.cache.getaddrinfo('localhost', 80, 0, socket.SOCK_STREAM)
+        second = self.cache.getaddrinfo('localhost', 80, 0, socket.SOCK_STREAM)
+        self.assertTrue(first is second)
+        self.assertEqual(1, self.cache.stats()['hits'])
+        self.assertEqual(1, self.cache.stats()['misses'])
+
+    def testExpiry(self):
+        self.cache.ttl = 0
+        first = self.cache.getaddrinfo('localhost', 80)
+        self.assertFalse(first is self.cache.getaddrinfo('localhost', 80))
+        self.assertEqual(0, self.cache.stats()['size'])
+
+    def testInvalidate(self):
+        self.cache.getaddrinfo('localhost', 80)
+        self.cache.getaddrinfo('localhost', 81)
+        self.cache.invalidate('localhost', 80)
+        self.assertEqual(1, self.cache.stats()['size'])
+
+    def testConnectFailureInvalidates(self):
+        conn = httplib2.HTTPConnectionWithTimeout('localhost', 1)
+        self.assertRaises(socket.error, conn.connect)
+        self.assertFalse(
+            [k for k in httplib2.DNS_CACHE._entries if k[:2] == ('localhost', 1)])
+
+
+class PrewarmTest(unittest.TestCase):
+    def setUp(self):
+        self.httpd, self.port = miniserver.start_server(
+            miniserver.ThisDirHandler)
+
+    def tearDown(self):
+        self.httpd.shutdown()
+
+    def uri(self, src):
+        return 'http://localhost:%d/%s' % (self.port, src)
+
+    def testPrewarm(self):
+        client = httplib2.Http()
+        self.assertEqual(1, client.prewarm(
+            [self.uri('miniserver.py'), self.uri('smoke_test.py')]))
+
+        conn = client.connections['http:localhost:%d' % self.port]
+        self.assertTrue(conn.sock is not None)
+
+        # Already open
+        self.assertEqual(0, client.prewarm([self.uri('miniserver.py')]))
+
+        # The request uses the open connection
+        connects = []
+        conn.connect = lambda: connects.append(1)
+        response, body = client.request(self.uri('miniserver.py'))
+        self.assertEqual(200, response.status)
+        self.assertEqual([], connects)
+
+    def testPrewarmFailure(self):
+        client = httplib2.Http()
+        self.assertEqual(0, client.prewarm(['http://localhost:1/']))
+        self.assertTrue(client.connections['http:localhost:1'].sock is None)
+
+        # The request made so that the server can be shut down
+        response, body = client.request(self.uri('miniserver.py'))
+        self.assertEqual(200, response.status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Tests for Http.request_many()."""
+import os
+import unittest
+
+import httplib2
+
+from httplib2.test import miniserver
+
+
+class RequestManyTest(unittest.TestCase):
+    def setUp(self):
+        self.httpd, self.port = miniserver.start_server(
+            miniserver.ThisDirHandler)
+
+    def tearDown(self):
+        self.httpd.shutdown()
+
+    def uri(self, src):
+        return 'http://localhost:%d/%s' % (self.port, src)
+
+    def testOrder(self):
+        srcs = ['miniserver.py', 'smoke_test.py', '__init__.py',
+                'test_no_socket.py', 'other_cacerts.txt']
+        client = httplib2.Http()
+        results = client.request_many(
+            [self.uri(src) for src in srcs[:3]] +
+            [{'uri': self.uri(src), 'method': 'GET'} for src in srcs[3:]],
+            max_connections=3)
+
+        self.assertEqual(len(srcs), len(results))
+        for src, (response, body) in zip(srcs, results):
+            self.assertEqual(200, response.status)
+            self.assertEqual(
+                open(os.path.join(miniserver.HERE, src)).read(), body)
+
+        # Connections are kept for re-use by later calls
+        self.assertEqual(3, len(client._workers))
+
+    def testError(self):
+        client = httplib2.Http()
+        self.assertRaises(
+            httplib2.RelativeURIError, client.request_many,
+            [self.uri('miniserver.py'), '/relative'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Tests for the Response header container."""
+import copy
+import json
+import pickle
+import sys
+import unittest
+
+import httplib2
+
+from httplib2.test import miniserver
+
+
+class ResponseTest(unittest.TestCase):
+    def testDictCompatible(self):
+        response = httplib2.Response({'content-type': 'text/html'})
+        self.assertEqual({'content-type': 'text/html'}, dict(response))
+        self.assertEqual('{"content-type": "text/html"}', json.dumps(response))
+        d = {}
+        d.update(response)
+        self.assertEqual({'content-type': 'text/html'}, d)
+        self.assertEqual(200, response.status)
+        self.assertTrue(isinstance(response, dict))
+
+    def testDuplicateHeaders(self):
+        response = httplib2.Response(
+            [('status', '200'), ('etag', '"a"'), ('etag', '"b"')])
+        self.assertEqual('"b"', response['etag'])
+        self.assertEqual('"b"', response.get('etag'))
+        self.assertEqual('"b"', dict(response)['etag'])
+
+    def testDictOperations(self):
+        response = httplib2.Response({'status': '200', 'etag': '"x"'})
+        response['location'] = '/elsewhere'
+        del response['etag']
+        self.assertEqual({'status': '200', 'location': '/elsewhere'},
+                         dict(response))
+        self.assertEqual(2, len(response))
+        self.assertEqual(['location', 'status'], sorted(response))
+
+    def testCopy(self):
+        response = httplib2.Response([('status', '301'), ('etag', '"x"')])
+        response.previous = httplib2.Response({'status': '302'})
+        response._stale_digest = 1
+
+        for r in [copy.deepcopy(response),
+                  pickle.loads(pickle.dumps(response, 2))]:
+            self.assertEqual(dict(response), dict(r))
+            self.assertEqual(301, r.status)
+            self.assertEqual(302, r.previous.status)
+            self.assertEqual(1, r._stale_digest)
+
+    def testAttributes(self):
+        response = httplib2.Response({})
+        self.assertEqual(200, response.status)
+        self.assertFalse(response.fromcache)
+        self.assertFalse(hasattr(response, '_stale_digest'))
+        self.assertTrue(response.dict is response)
+        self.assertRaises(AttributeError, setattr, response, 'foo', 1)
+
+    def testNoInstanceDict(self):
+        # Responses whose attributes lived in an instance dictionary cost
+        # about 250 bytes more each
+        response = httplib2.Response({'status': '200'})
+        response.reason = 'OK'
+        response.version = 10
+        response.previous = httplib2.Response({})
+        self.assertFalse(hasattr(response, '__dict__'))
+        self.assertTrue(sys.getsizeof(response) <
+                        sys.getsizeof({}) + sys.getsizeof(dict(response)))
+
+
+class HttpResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.httpd, self.port = miniserver.start_server(
+            miniserver.ThisDirHandler)
+
+    def tearDown(self):
+        self.httpd.shutdown()
+
+    def testHttpResponse(self):
+        client = httplib2.Http()
+        response, body = client.request(
+            'http://localhost:%d/missing' % self.port)
+        self.assertEqual(404, response.status)
+        self.assertEqual('404', response['status'])
+        self.assertTrue(dict(response)['content-type'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+"""Tests for the shared SSL contexts used by HTTPSConnectionWithTimeout."""
+import os
+import unittest
+
+import httplib2
+
+from httplib2.test import miniserver
+
+
+class SSLContextTest(unittest.TestCase):
+    def setUp(self):
+        if not hasattr(httplib2, '_get_ssl_context'):
+            self.skipTest('ssl.SSLContext is not available')
+
+    def testShared(self):
+        context = httplib2._get_ssl_context(
+            None, None, False, httplib2.CA_CERTS)
+        self.assertTrue(context is httplib2._get_ssl_context(
+            None, None, False, httplib2.CA_CERTS))
+        self.assertTrue(context.cert_store_stats()['x509_ca'] > 0)
+
+    def testDistinct(self):
+        other_ca_certs = os.path.join(miniserver.HERE, 'other_cacerts.txt')
+        contexts = [
+            httplib2._get_ssl_context(None, None, False, httplib2.CA_CERTS),
+            httplib2._get_ssl_context(None, None, False, other_ca_certs),
+            httplib2._get_ssl_context(None, None, True, httplib2.CA_CERTS)]
+        self.assertEqual(3, len(set(map(id, contexts))))
+        self.assertEqual(
+            httplib2.ssl.CERT_NONE, contexts[2].verify_mode)
+
+
+if __name__ == '__main__':
+    unittest.main()
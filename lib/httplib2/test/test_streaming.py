@@ -0,0 +1,122 @@
+"""Tests for streaming response bodies."""
+import BaseHTTPServer
+import gzip
+import logging
+import StringIO
+import unittest
+
+import httplib2
+
+from httplib2.test import miniserver
+from httplib2.test.test_cache_format import DictCache
+
+logger = logging.getLogger(__name__)
+
+BODY = ''.join(['line %d of the body\n' % i for i in range(20000)])
+
+
+def gzip_compress(data):
+    buf = StringIO.StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+GZIPPED_BODY = gzip_compress(BODY)
+
+
+class BodyHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/gzip':
+            body = GZIPPED_BODY
+        else:
+            body = BODY
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        if self.path == '/gzip':
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, s, *args):
+        logger.info(s, *args)
+
+
+class StreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.httpd, self.port = miniserver.start_server(BodyHandler)
+        self.client = httplib2.Http()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+
+    def uri(self, path):
+        return 'http://localhost:%d%s' % (self.port, path)
+
+    def testPlain(self):
+        response, body = self.client.request(self.uri('/plain'), stream=True)
+        self.assertEqual(200, response.status)
+        self.assertTrue(isinstance(body, httplib2.StreamingBody))
+        self.assertEqual(BODY[:10], body.read(10))
+        self.assertEqual(BODY[10:], body.read())
+
+    def testGzip(self):
+        response, body = self.client.request(self.uri('/gzip'), stream=True)
+        self.assertEqual('gzip', response['-content-encoding'])
+        self.assertFalse('content-encoding' in response)
+        self.assertFalse('content-length' in response)
+
+        chunks = list(body)
+        for c in chunks:
+            self.assertTrue(len(c) <= httplib2.STREAM_CHUNK_SIZE)
+        self.assertEqual(BODY, ''.join(chunks))
+
+    def testCloseEarly(self):
+        response, body = self.client.request(self.uri('/plain'), stream=True)
+        body.read(10)
+        body.close()
+
+        response, body = self.client.request(self.uri('/plain'))
+        self.assertEqual(BODY, body)
+
+
+class StreamingBodyTest(unittest.TestCase):
+    def gzipped(self, data):
+        return StringIO.StringIO(gzip_compress(data))
+
+    def testBoundedInflation(self):
+        # 16MB of zeros compresses to a single network chunk
+        body = httplib2.StreamingBody(
+            self.gzipped('\0' * (16 * 1024 * 1024)), encoding='gzip')
+        self.assertEqual('\0' * 10, body.read(10))
+        self.assertTrue(body._buffered <= httplib2.STREAM_CHUNK_SIZE)
+        self.assertEqual(16 * 1024 * 1024 - 10, len(body.read()))
+
+    def testSmallReads(self):
+        body = httplib2.StreamingBody(self.gzipped(BODY), encoding='gzip')
+        chunks = []
+        while True:
+            data = body.read(7)
+            if not data:
+                break
+            chunks.append(data)
+        self.assertEqual(BODY, ''.join(chunks))
+
+
+class StreamingCacheTest(unittest.TestCase):
+    def testFreshCacheEntry(self):
+        cache = DictCache()
+        client = httplib2.Http(cache=cache)
+        cache.set('http://localhost:1/cached', httplib2._encode_cache_entry(
+            200, [('content-type', 'text/plain')], 'cached body'))
+
+        response, body = client.request(
+            'http://localhost:1/cached', stream=True,
+            headers={'cache-control': 'only-if-cached'})
+        self.assertTrue(response.fromcache)
+        self.assertEqual('cached body', body.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Tests for memoized URI normalization."""
+import unittest
+
+import httplib2
+
+
+class LRUCacheTest(unittest.TestCase):
+    def testHitsAndMisses(self):
+        calls = []
+        def compute(key):
+            calls.append(key)
+            return key.upper()
+
+        cache = httplib2.LRUCache(10)
+        self.assertEqual('A', cache.get('a', compute))
+        self.assertEqual('A', cache.get('a', compute))
+        self.assertEqual(['a'], calls)
+        self.assertEqual(
+            {'hits': 1, 'misses': 1, 'size': 1, 'hit_rate': 0.5},
+            cache.stats())
+
+    def testEviction(self):
+        cache = httplib2.LRUCache(4)
+        for key in ['a', 'b', 'c', 'd']:
+            cache.get(key, str.upper)
+        cache.get('a', str.upper)
+        cache.get('e', str.upper)
+
+        self.assertEqual(2, cache.stats()['size'])
+        self.assertEqual(['a', 'e'], sorted(cache._entries.keys()))
+
+    def testErrorsNotCached(self):
+        self.assertRaises(httplib2.RelativeURIError, httplib2.URI_CACHE.get,
+                          '/relative', httplib2._normalize_uri)
+        self.assertRaises(httplib2.RelativeURIError, httplib2.URI_CACHE.get,
+                          '/relative', httplib2._normalize_uri)
+
+
+class NormalizeTest(unittest.TestCase):
+    def testNormalizeUri(self):
+        self.assertEqual(
+            ('http://Example.com/a?b#c', 'http', 'example.com', '/a?b',
+             'http://example.com/a?b'),
+            httplib2._normalize_uri('http://Example.com/a?b#c'))
+
+    def testSafename(self):
+        uri = 'http://example.com/some/path?q=1'
+        self.assertEqual(httplib2._safename(uri), httplib2.safename(uri))
+        hits = httplib2.SAFENAME_CACHE.hits
+        httplib2.safename(uri)
+        self.assertEqual(hits + 1, httplib2.SAFENAME_CACHE.hits)
+
+
+if __name__ == '__main__':
+    unittest.main()